@@ -3,13 +3,175 @@ Created on Thu Jul 20 08:24:55 2017
 ref: http://www.datadependence.com/2016/04/how-to-build-gui-in-python-3/
 @author: Howard J. Seltman
 """
+import codecs
+import collections
+import concurrent.futures
+import itertools
+import os
+import os.path
+import re
+import shutil
+import subprocess
+import time
+from pathlib import Path
 import tkinter as tk
 import tkinter.ttk as ttk
 from tkinter import messagebox
 from tkinter import filedialog
+from tkinter import font as tkfont
+import pandas as pd
 from tkSimpleDialog import Dialog
 # from tkinter.simpledialog import Dialog
 
+# Regular expressions used on every config read or student file are
+# compiled once here rather than inside the methods.
+_CONFIG_ENTRY_RE = re.compile(r"^\s*([a-zA-Z_0-9]+):\s*(.*)", re.DOTALL)
+_BLANK_LINES_RE = re.compile(r"\n{2,}")
+_POINTS_RE = re.compile(r"^[{]([-+]?[0-9.]+?)[}][ ]*([^ ]+.*$)")
+_HASH_COMMENT_RE = re.compile(r"^\s*#")
+_SAS_COMMENT_RE = re.compile(r"^\s*[/][*]")
+_BLANK_RE = re.compile(r"^\s*$")
+_R_WARNING_RE = re.compile(r"^Warning message:", re.MULTILINE)
+_R_ERROR_RE = re.compile(r"^(Error in|Error:)", re.MULTILINE)
+_R_IGNORE_RE = re.compile(r"package .* was built under R version")
+_SAS_IGNORE_RE = re.compile(r"Errors printed on page")
+_SAS_MESSAGE_STARTS = (b"ERROR:", b"WARNING:")
+# SAS listing line-drawing and page-break characters as plain text
+_SAS_TRANS = str.maketrans({chr(402): "-", chr(12): "\n"})
+_CODEFILE_EXTS = (".r", ".rmd", ".rrmd", ".sas", ".py")
+_RRMD_STAR_EXTS = (".r", ".rmd", ".sas", ".py")
+_R_BATCH_ARGS = ["R", "CMD", "BATCH", "--no-save", "--no-restore", "--quiet"]
+# Code rewrites applied before running submissions.  Leading blanks are
+# "[ \t]*": Python's re has no POSIX "[:blank:]" class.  Python code is
+# only rewritten at the start of a line, since indenting the "###" comment
+# would leave an empty block.
+_HELP_Q_RE = re.compile(r"((^|\n)[ \t]*)([?])")
+_HELP_FN_RE = re.compile(r"((^|\n)[ \t]*)help[(]")
+_PY_HELP_Q_RE = re.compile(r"(^|\n)[?]")
+_PY_HELP_FN_RE = re.compile(r"(^|\n)help[(]")
+_PDF_DOC_RE = re.compile(r"pdf_document")
+_WORD_DOC_RE = re.compile(r"(w|W)ord_document")
+_FIRST_R_RE = re.compile(r"\n\s*```\s*[{]\s*(r|R)")
+_SAS_WD_RE = re.compile(r"((^|\n)\s*)(%LET\s+WD\s*=.*;)", re.IGNORECASE)
+_STAR4_RE = re.compile(r"[*]{4}")
+_STAR8_RE = re.compile(r"[*]{8}")
+_CR_RUN_RE = re.compile(r"\r+\n")
+# Regex syntax that changes meaning when a line is fused with others:
+# backreferences and conditional groups can refer to the wrong group,
+# and inline global flags (e.g., "(?i)") would apply to every line on
+# Python < 3.11
+_UNFUSABLE_RE = re.compile(r"\\[1-9]|[(][?](P=|[(]|[aiLmsux]+[)])")
+
+# Roster full name construction for each general config 'filename_name_fmt'.
+# Arguments are first and last names (strings or whole pandas columns).
+_NAME_FMTS = {
+    'Last, First': lambda f, l: l + ', ' + f,
+    'Last.First': lambda f, l: l + '.' + f,
+    'First.Last': lambda f, l: f + '.' + l,
+    'FirstLast': lambda f, l: f + l,
+    'LastFirst': lambda f, l: l + f,
+    }
+_DEFAULT_NAME_FMT = lambda f, l: f + ' ' + l  # noqa: E731
+
+# ConfigDialog widget (in 'master', for config setup entry 'setup') and
+# widget contents for each config setup type
+_CONFIG_WIDGETS = {
+    'int': lambda master, setup: ttk.Entry(master),
+    'box': lambda master, setup: tk.Text(master, height=setup[3][0],
+                                         width=setup[3][1]),
+    'line': lambda master, setup: tk.Entry(master, width=setup[3]),
+    }
+_CONFIG_GETTERS = {
+    'int': lambda widget: widget.get().strip(),
+    'box': lambda widget: widget.get(1.0, tk.END),
+    'line': lambda widget: widget.get(),
+    }
+
+
+def with_lookahead(lines, n):
+    """
+    For each element of iterable 'lines', yield a deque holding it followed
+    by (up to) the 'n' elements after it.  The same deque is reused, so it
+    must be used before asking for the next one.  Only n + 1 elements are
+    held at a time, so 'lines' may be a file.
+    """
+    lines = iter(lines)
+    window = collections.deque(itertools.islice(lines, n), maxlen=n + 1)
+    # Appending to the full window drops the element already yielded
+    for line in lines:
+        window.append(line)
+        yield window
+    if len(window) == n + 1:
+        window.popleft()
+    while window:
+        yield window
+        window.popleft()
+
+
+def message_tail(following, ends_message):
+    """
+    Return the lines (at most 3) of iterable 'following' that continue a
+    log message: those before the first empty line or the first line
+    whose first character satisfies 'ends_message'.  The lines may be
+    strings or bytes.
+    """
+    tail = []
+    for line in itertools.islice(following, 3):
+        first = line[:1]
+        if len(first) == 0 or ends_message(first):
+            break
+        tail.append(line)
+    return tail
+
+
+def run_in_sandbox(runstring, sandbox):
+    """
+    Run 'runstring' (one command or a list of them) with directory
+    'sandbox' as the working directory, and return the exit code of the
+    last command.  Each command is a dictionary with the argument list as
+    'args' and, optionally, file names (in 'sandbox') for 'stdin',
+    'stdout' and 'stderr'; or with just 'open', a file to show in its
+    default program (like the Windows "start" command).  No shell is used.
+    This touches no GUI state, so run_all() can call it from worker
+    threads.
+    """
+    if type(runstring) is dict:
+        runstring = [runstring]
+    code = None
+    for command in runstring:
+        if 'open' in command:
+            if hasattr(os, 'startfile'):
+                os.startfile(command['open'])
+            code = 0
+            continue
+        files = {}
+        try:
+            for stream in ('stdin', 'stdout', 'stderr'):
+                if stream in command:
+                    files[stream] = open(os.path.join(sandbox,
+                                                      command[stream]),
+                                         'rb' if stream == 'stdin' else 'wb')
+            code = subprocess.run(command['args'], cwd=sandbox,
+                                  **files).returncode
+        except OSError:
+            code = 127  # as a shell reports a missing program
+        finally:
+            for f in files.values():
+                f.close()
+    return code
+
+
+def scrolled_text(parent, **kwargs):
+    """
+    Make a Text widget in 'parent', with Text options 'kwargs', and a
+    vertical Scrollbar wired to it, which is left out of keyboard focus
+    traversal.  Returns (text, scrollbar), neither of which is placed yet.
+    """
+    scrollbar = tk.Scrollbar(parent, takefocus=0)
+    text = tk.Text(parent, yscrollcommand=scrollbar.set, **kwargs)
+    scrollbar.config(command=text.yview)
+    return (text, scrollbar)
+
 
 class AutoGrader(ttk.Frame):
     """
@@ -64,6 +226,20 @@ class AutoGrader(ttk.Frame):
     Current acceptable codefiles are *.R, *.Rmd, *.RRmd (indicating either
     *.R or *.Rmd), *.sas, and *.py.
     """
+    # Notebook tabs as (name, title), in display order
+    _tab_titles = (('input', 'input'),
+                   ('input_analysis', 'input analysis'),
+                   ('messages', 'messages'),
+                   ('output', 'output'),
+                   ('output_analysis', 'output analysis'),
+                   ('letter', 'letter'))
+    # Read-only tabs and their text when no student file is selected
+    _resettable = (('input', '(no code)'),
+                   ('input_analysis', '(no analysis)'),
+                   ('messages', '(no messages)'),
+                   ('output', '(no output)'),
+                   ('output_analysis', '(no analysis)'))
+
     def __init__(self, parent, *args, **kwargs):
         ttk.Frame.__init__(self, parent, *args, **kwargs)
         self.root = parent
@@ -125,26 +301,37 @@ class AutoGrader(ttk.Frame):
         required code lines, and required output lines.  The latter two are
         regular expressions.
         """
-        import os
-        import os.path
-        import re
 
         # Misc. initializations
         self.general_config_fname = "AutoGrader.config"
         self.specific_config_fname = "AutoGrader.specific.config"
         self.valid_file_fields = "stfejl"  # [see one_time_setup()]
+        self._valid_file_fields_set = frozenset(self.valid_file_fields)
+        self._valid_file_chars = frozenset("%" + self.valid_file_fields)
         self.max_codefiles = 10
         SAS_loc = os.environ.get("SAS_LOCATION")
         if SAS_loc is None:
             SAS_loc = "C:\Program Files\SasHome\SASFOUNDATION\9.4"
         self.SAS_prog = os.path.join(SAS_loc, "sas.exe")
         self.active_letter_file = None
-        self.re_points = re.compile("^[{]([-+]?[0-9.]+?)[}][ ]*([^ ]+.*$)")
+        self._letter_saved_text = None
+        self._shown_student = None  # (directory, code file) in the tabs
+        self._config_cache = {}  # path -> (mod. time, parsed items)
+        self._regex_memo = {}  # (pattern, flags) -> compiled regex
+        # Per-config caches, keyed by config file name (and item), with
+        # values (config, mod. time, value) that are only valid for that
+        # very config dictionary; cleared when the configs are replaced.
+        self._req_prohib_cache = {}  # (name, item) -> (..., entry list)
+        self._fused_memo = {}  # (name, item) -> (..., fused regex)
+        self._warning_ignore_cache = {}  # name -> (..., ignore regex)
+        self._tab_text = {}  # tab name -> text (not the pane's letter edits)
+        self._text_cache = {}  # path -> ((mtime, size), text), oldest first
+        self._dir_snapshot = None  # ((path, mtime, size), file names)
+        self.text_cache_size = 64
 
         # Allow environmental variable to set starting directory if no
         # configuration file is in the working directory.
-        files = os.listdir()
-        if "autoGrader.config" not in files:
+        if not os.path.isfile("autoGrader.config"):
             self.start_loc = os.environ.get("AUTOGRADER_STARTLOC")
             if self.start_loc is not None:
                 try:
@@ -191,36 +378,20 @@ class AutoGrader(ttk.Frame):
                  ('code_append', 'Code to append:', 'box', (3, 50), ''),
                 )
 
-        # Initialize global general configuration from setup tuple, then
-        # replace any elements from global general configuration file (if
-        # found).  Nate that later, a local general configuration file may
-        # overwrite these.)
+        # Initialize global general and specific configurations from their
+        # setup tuples, then replace any elements from the corresponding
+        # global configuration files (if found).  Note that later, local
+        # configuration files may overwrite these.
         env_loc = os.environ.get("AUTOGRADER_GLOBAL_CONFIG")
         global_loc = "~" if env_loc is None else env_loc
+        self._global_config_dir = os.path.expanduser(global_loc)
         self.global_general_config = \
-            self.construct_config(self.general_config_setup)
-        global_config_name = os.path.join(os.path.expanduser(global_loc),
-                                          self.general_config_fname)
-        if os.path.isfile(global_config_name):
-            self.global_general_config = \
-                self.update_config_from_file(global_config_name,
-                                             self.global_general_config,
-                                             self.general_config_setup)
+            self.load_global_config(self.general_config_fname,
+                                    self.general_config_setup)
         self.general_config = None
-
-        # Initialize global specific configuration from setup tuple, then
-        # replace any elements from global specific configuration file (if
-        # found).  Nate that later, a local specific configuration file may
-        # overwrite these.)
         self.global_specific_config = \
-            self.construct_config(self.specific_config_setup)
-        global_config_name = os.path.join(os.path.expanduser(global_loc),
-                                          self.specific_config_fname)
-        if os.path.isfile(global_config_name):
-            self.global_specific_config = \
-                self.update_config_from_file(global_config_name,
-                                             self.global_specific_config,
-                                             self.specific_config_setup)
+            self.load_global_config(self.specific_config_fname,
+                                    self.specific_config_setup)
         self.specific_configs = None
 
         # No codefiles are defined yet, so we point to nothing
@@ -228,9 +399,23 @@ class AutoGrader(ttk.Frame):
         # file_format not yet decoded; roster not yet read
         self.filename_separator = None
         self.roster_id = None
+        self._roster_re = None
+        self._roster_re_course = None
         self.current_code = None
         return
 
+    def load_global_config(self, fname, config_setup):
+        """
+        Construct a config dictionary from 'config_setup' and update it from
+        file 'fname' in the global configuration directory, if present.
+        """
+        config = self.construct_config(config_setup)
+        global_config_name = os.path.join(self._global_config_dir, fname)
+        if os.path.isfile(global_config_name):
+            config = self.update_config_from_file(global_config_name,
+                                                  config, config_setup)
+        return config
+
     def set_file_format_info(self, file_format):
         """
         Read a 'file_format' and set self.filename_separator and
@@ -243,15 +428,14 @@ class AutoGrader(ttk.Frame):
             "'%s' for student name, '%e' for email address, '%j' for\n" + \
             "junk (anything else), and '%l' for optional 'late'.  Email\n" + \
             "or student name is required."
-        chars = set([x for x in file_format])
-        seps = [x for x in chars if x not in "%" + self.valid_file_fields]
+        seps = list(set(file_format) - self._valid_file_chars)
 
         sep = seps[0] if len(seps) == 1 else "_"
         fmt = file_format.split(sep)
-        bad = [x[1:] not in self.valid_file_fields for x in fmt] or \
-            fmt[0] == "%l"
-        inadequate = '%s' not in fmt and '%e' not in fmt
-        if len(seps) != 1 or len(fmt) < 2 or any(bad) or inadequate:
+        valid = self._valid_file_fields_set
+        if len(seps) != 1 or len(fmt) < 2 or fmt[0] == "%l" or \
+                ('%s' not in fmt and '%e' not in fmt) or \
+                any(x[1:] not in valid for x in fmt):
             messagebox.showwarning("Bad 'File format' in general setup",
                                    instructions)
             file_format = self.global_general_config['file_format']
@@ -276,11 +460,7 @@ class AutoGrader(ttk.Frame):
         specified in the comments on one_time_setup().
         Element order is  0=id, 1=label, 2=type, 3=dim, 4=default.
         """
-        import time
-        rslt = {}
-        for i in range(len(setup_tuple)):
-            this = setup_tuple[i]
-            rslt[this[0]] = this[4]
+        rslt = {this[0]: this[4] for this in setup_tuple}
         rslt['config_mod_time'] = time.time()
         return rslt
 
@@ -289,11 +469,9 @@ class AutoGrader(ttk.Frame):
         Generate general configuration based on global general configuration
         and configuration file in the current (local) directory.
         """
-        import os
-        import copy
         old_file_format = self.general_config['file_format']
         old_course_id = self.general_config['course_id']
-        self.general_config = copy.copy(self.global_general_config)
+        self.general_config = self.global_general_config.copy()
         local_config_name = os.path.join(self.dir, self.general_config_fname)
         if os.path.isfile(local_config_name):
             self.general_config = self.update_config_from_file(
@@ -309,9 +487,6 @@ class AutoGrader(ttk.Frame):
         return
 
     def read_roster(self):
-        import os
-        import re
-        import pandas as pd
         if self.general_config['course_id'] == '':
             self.roster_firstname = None
             self.roster_lastname = None
@@ -319,13 +494,21 @@ class AutoGrader(ttk.Frame):
             self.roster_fullname = None
 
         course = self.general_config['course_id']
-        roster_re = re.compile(course + ".*[.]csv$", re.IGNORECASE)
-        env_loc = os.environ.get("AUTOGRADER_GLOBAL_CONFIG")
-        env_loc = os.path.expanduser("~" if env_loc is None else env_loc)
+        if course != self._roster_re_course:
+            self._roster_re = re.compile(re.escape(course) + r".*[.]csv\Z",
+                                         re.IGNORECASE)
+            self._roster_re_course = course
+        roster_re = self._roster_re
+        env_loc = self._global_config_dir
+        # Only whether there are zero, one, or several candidates matters
+        # (several means asking the user), so stop scanning at two.
         candidates = []
-        for file in os.listdir(env_loc):
-            if roster_re.search(file) is not None:
-                candidates.append(file)
+        with os.scandir(env_loc) as entries:
+            for entry in entries:
+                if roster_re.search(entry.name) is not None:
+                    candidates.append(entry.name)
+                    if len(candidates) > 1:
+                        break
 
         if len(candidates) == 0:
             self.roster_firstname = None
@@ -349,64 +532,47 @@ class AutoGrader(ttk.Frame):
                 self.roster_fullname = None
                 return
 
-        roster = pd.read_csv(candidate)
+        # Only parse the needed columns, as text (no type inference).
+        config = self.general_config
+        wanted = set([config['roster_name_col'],
+                      config['roster_firstname_col'],
+                      config['roster_lastname_col'],
+                      config['roster_email_col']])
+        roster = pd.read_csv(candidate, usecols=lambda c: c in wanted,
+                             dtype=str, keep_default_na=False)
 
         # Read and store specific roster info
         self.roster_id = self.general_config['course_id']
-        colnames = list(roster.columns.values)
+        colnames = frozenset(roster.columns)
+        first = None
         colname = self.general_config['roster_firstname_col']
-        self.roster_firstname = None
-        if colname != '':
-            hascol = colnames.count(colname)
-            if hascol > 0:
-                self.roster_firstname = roster[colname].tolist()
+        if colname != '' and colname in colnames:
+            first = roster[colname]
+        last = None
         colname = self.general_config['roster_lastname_col']
-        self.roster_lastname = None
-        if colname != '':
-            hascol = colnames.count(colname)
-            if hascol > 0:
-                self.roster_lastname = roster[colname].tolist()
+        if colname != '' and colname in colnames:
+            last = roster[colname]
+        email = None
         colname = self.general_config['roster_email_col']
-        self.roster_email = None
-        if colname != '':
-            hascol = colnames.count(colname)
-            if hascol > 0:
-                self.roster_email = roster[colname].tolist()
-
-        if self.roster_firstname is None or \
-                self.roster_lastname is None:
+        if colname != '' and colname in colnames:
+            email = roster[colname]
+
+        self.roster_firstname = None if first is None else first.tolist()
+        self.roster_lastname = None if last is None else last.tolist()
+        if first is None or last is None:
             self.roster_fullname = None
         else:
-            if self.general_config['filename_name_fmt'] == 'Last, First':
-                self.roster_fullname = [b + ', ' + a for (a, b) in
-                                        zip(self.roster_firstname,
-                                            self.roster_lastname)]
-            elif self.general_config['filename_name_fmt'] == 'Last.First':
-                self.roster_fullname = [b + '.' + a for (a, b) in
-                                        zip(self.roster_firstname,
-                                            self.roster_lastname)]
-            elif self.general_config['filename_name_fmt'] == 'First.Last':
-                self.roster_fullname = [a + '.' + b for (a, b) in
-                                        zip(self.roster_firstname,
-                                            self.roster_lastname)]
-            elif self.general_config['filename_name_fmt'] == 'FirstLast':
-                self.roster_fullname = [a + b for (a, b) in
-                                        zip(self.roster_firstname,
-                                            self.roster_lastname)]
-            elif self.general_config['filename_name_fmt'] == 'LastFirst':
-                self.roster_fullname = [b + a for (a, b) in
-                                        zip(self.roster_firstname,
-                                            self.roster_lastname)]
-            else:
-                self.roster_fullname = [a + " " + b for (a, b) in
-                                        zip(self.roster_firstname,
-                                            self.roster_lastname)]
+            fmt = self.general_config['filename_name_fmt']
+            name_fmt = _NAME_FMTS.get(fmt, _DEFAULT_NAME_FMT)
             # Make lower case for easy matching
-            self.roster_fullname = [s.lower() for s in self.roster_fullname]
+            self.roster_fullname = name_fmt(first, last).str.lower().tolist()
 
         # Remove @domain from emails
-        self.roster_email = [re.sub("@.*", "", s.lower()) for s in
-                             self.roster_email]
+        if email is None:
+            self.roster_email = None
+        else:
+            self.roster_email = \
+                email.str.lower().str.partition('@')[0].tolist()
         return
 
     def set_specific_configs(self):
@@ -420,10 +586,12 @@ class AutoGrader(ttk.Frame):
         current directory.
         Returns the dictionary of dictionaries
         """
-        import copy
         self.specific_configs = {}
+        self._req_prohib_cache.clear()
+        self._fused_memo.clear()
+        self._warning_ignore_cache.clear()
         for file in self.codefiles:
-            specific_config_inner = copy.copy(self.global_specific_config)
+            specific_config_inner = self.global_specific_config.copy()
             local_config_name = file + ".config"
             specific_config_inner = \
                 self.update_config_from_file(local_config_name,
@@ -441,20 +609,26 @@ class AutoGrader(ttk.Frame):
         spanning several lines and with blank lines between items.  For each
         id that matches a config_setup 'id', store the value in config.dict.
         Return updated config.dict.
+        The parsed items are cached by file modification time, so an
+        unchanged file is not re-read.
         """
-        import time
-        import os.path
-        import re
+        try:
+            file_mod_time = os.path.getmtime(fname)
+        except OSError:
+            file_mod_time = None
+        cache_key = os.path.abspath(fname)
+        cached = self._config_cache.get(cache_key)
+        if cached is not None and cached[0] == file_mod_time:
+            config_dict.update(cached[1])
+            config_dict['config_mod_time'] = file_mod_time
+            return config_dict
 
-        text = []
         try:
-            fh = open(fname, 'r')
+            text = Path(fname).read_text()
         except IOError:
             if not write_if_missing:
                 messagebox.showwarning("Bad file", "Cannot open " + fname)
-        else:
-            text = fh.read()
-            fh.close()
+            text = ''
 
         if not text:
             config_dict['config_mod_time'] = time.time()
@@ -462,14 +636,12 @@ class AutoGrader(ttk.Frame):
             return config_dict
 
         # Update config_dict from text in file
-        file_mod_time = os.path.getmtime(fname)
-        config_dict['config_mod_time'] = file_mod_time
-        ids = [x[0] for x in config_setup]
-        text = text.split("\n\n")
-        text = [t for t in text if len(t) > 0]
-        for line in text:
-            re.header = re.compile("^\s*([a-zA-Z_0-9]+):\s*((.|\n)*)")
-            colon = re.header.search(line)
+        parsed = {}
+        setup_by_id = {x[0]: x for x in config_setup}
+        records = [t for t in _BLANK_LINES_RE.split(text) if t]
+        match_entry = _CONFIG_ENTRY_RE.match
+        for line in records:
+            colon = match_entry(line)
             if colon is None:
                 messagebox.showwarning("Bad file format",
                                        "Missing colon in " + fname)
@@ -480,43 +652,49 @@ class AutoGrader(ttk.Frame):
                 value = ' '
             if value[-1] == "\n":
                 value = value[:-1]
-            m = ids.count(id)
-            if m != 1 and id != 'config_mod_time':
+            if id == 'config_mod_time':
+                continue
+            setup = setup_by_id.get(id)
+            if setup is None:
                 messagebox.showwarning("Bad config info",
                                        "Invalid id '" + id + "' in " +
                                        fname)
-            elif id == 'config_mod_time':
-                pass
+            elif setup[2] == 'int':
+                try:
+                    parsed[id] = int(value)
+                except ValueError:
+                    messagebox.showwarning("Bad config. info",
+                                           "In " + fname + ", " +
+                                           setup[0] +
+                                           " must be an integer.")
+            elif setup[2] == 'box':
+                parsed[id] = value
+            elif setup[2] == 'line':
+                parsed[id] = value
             else:
-                m = ids.index(id)
-                if config_setup[m][2] == 'int':
-                    try:
-                        config_dict[id] = int(value)
-                    except ValueError:
-                        messagebox.showwarning("Bad config. info",
-                                               "In " + fname + ", " +
-                                               config_setup[m][0] +
-                                               " must be an integer.")
-                elif config_setup[m][2] == 'box':
-                    config_dict[id] = value
-                elif config_setup[m][2] == 'line':
-                    config_dict[id] = value
-                else:
-                    messagebox.showwarning("Error!", "bad config def.")
-                    return
+                messagebox.showwarning("Error!", "bad config def.")
+                return
+        if file_mod_time is not None:
+            self._config_cache[cache_key] = (file_mod_time, parsed)
+        config_dict.update(parsed)
+        config_dict['config_mod_time'] = file_mod_time
         return config_dict
 
     def write_config_file(self, fname, config_dict):
-        with open(fname, 'w') as out:
-            try:
-                for id in config_dict.keys():
-                    value = config_dict[id]
-                    if type(value) is int or type(value) is float:
-                        value = str(value)
-                    out.write(id + ": " + value + '\n\n')
-            except IOError:
-                messagebox.showwarning("File write error",
-                                       "Could not write " + fname)
+        """
+        Write 'config_dict' to 'fname' as blank-line separated 'id: value'
+        items (see update_config_from_file()) using a single write, and
+        drop its parsed items from the config cache.
+        """
+        items = [id + ": " + str(value) + "\n\n"
+                 for (id, value) in config_dict.items()]
+        self._config_cache.pop(os.path.abspath(fname), None)
+        try:
+            with open(fname, 'w') as out:
+                out.write("".join(items))
+        except IOError:
+            messagebox.showwarning("File write error",
+                                   "Could not write " + fname)
         return
 
     def setup_for_new_dir(self):
@@ -525,11 +703,9 @@ class AutoGrader(ttk.Frame):
         self.global_general_config, any general config file in the current
         directory, and 'codefiles' (possibly wildcard).
         """
-        import os
-        import copy
 
         self.dir = os.getcwd()
-        self.general_config = copy.copy(self.global_general_config)
+        self.general_config = self.global_general_config.copy()
         self.update_general_config()
         self.get_codefiles()
         self.get_student_files(forceFirst=True)
@@ -559,8 +735,8 @@ class AutoGrader(ttk.Frame):
         """
         # Special case: no codefiles
         if self.codefiles is None:
-            for i in range(self.max_codefiles):
-                self.cf_radio_dict[i].config(state=tk.DISABLED)
+            for radio in self.cf_radios:
+                radio.config(state=tk.DISABLED)
             self.specific_configs = None
             self.fullname = self.filename = self.version = self.timestamp = \
                 self.student_name = self.email = None
@@ -570,18 +746,24 @@ class AutoGrader(ttk.Frame):
             return
 
         # Set codefile radio buttons for new codefiles
+        # (Buttons that were never active have no StringVar yet.)
         cf_n = len(self.codefiles)
-        for i in range(self.max_codefiles):
+        cf_texts = self.cf_texts
+        for (i, radio) in enumerate(self.cf_radios):
+            text = cf_texts[i]
             if i < cf_n:
-                self.cf_text_dict[i].set(self.codefiles[i])
-                self.cf_radio_dict[i].config(state=tk.NORMAL)
+                if text is None:
+                    text = cf_texts[i] = tk.StringVar()
+                    radio.config(textvariable=text)
+                text.set(self.codefiles[i])
+                radio.config(state=tk.NORMAL)
             else:
-                self.cf_text_dict[i].set('')
-                self.cf_radio_dict[i].config(state=tk.DISABLED)
+                if text is not None:
+                    text.set('')
+                radio.config(state=tk.DISABLED)
         self.codefile_index = 0
         self.codefile = self.codefiles[self.codefile_index]
         self.cf_index.set(self.codefile_index)
-        self.cf_radio_dict[self.codefile_index].select()
 
         # Set configuration menu for new codefiles
         self.menu_setup.entryconfig(self.setup_specific_loc,
@@ -598,9 +780,7 @@ class AutoGrader(ttk.Frame):
         return
 
     def choose_codefile(self, *args):
-        if self.active_letter_file is not None:
-            self.write_text(self.letter.get("1.0", "end-1c"),
-                            self.active_letter_file)
+        self.save_letter()
 
         self.codefile_index = self.cf_index.get()
         self.codefile = self.codefiles[self.codefile_index]
@@ -619,94 +799,87 @@ class AutoGrader(ttk.Frame):
         corresponding student files.
         """
         if self.codefiles is None:
-            self.dropdownMenu["menu"].delete(0, "end")
-            self.chosen_file.set('')
+            self.set_student_files([])
             self.dropdownMenu.config(state=tk.DISABLED)
-            self.file_count.config(text="File count: 0")
+            self.set_file_count(0)
             self.current_code = '(no code)'
-            self.input.configure(state="normal")
-            self.input.delete(1.0, tk.END)
-            self.input.insert(tk.END, self.current_code)
-            self.input.configure(state="disabled")
+            self.set_ro_text('input', self.current_code)
             return
 
         if self.file_label is None or len(self.student_name) == 0:
             self.dropdownMenu.config(state=tk.DISABLED)
-            self.file_count.config(text="File count: 0")
+            self.set_file_count(0)
             self.chosen_file.set('')
             self.current_code = '(no code)'
-            self.input.configure(state="normal")
-            self.input.delete(1.0, tk.END)
-            self.input.insert(tk.END, self.current_code)
-            self.input.configure(state="disabled")
+            self.set_ro_text('input', self.current_code)
 
         else:
-            menu = self.dropdownMenu["menu"]
-            menu.delete(0, "end")
-            for string in self.file_label:
-                menu.add_command(label=string,
-                                 command=lambda value=string:
-                                     self.chosen_file.set(value))
-
-            self.chosen_file.set(self.file_label[0])
+            self.set_student_files(self.file_label)
             self.dropdownMenu.config(state=tk.NORMAL)
-            self.file_count.config(text="File count: " +
-                                   str(len(self.file_label)))
+            self.set_file_count(len(self.file_label))
 
         self.update_selected_student()
         return
 
+    def set_file_count(self, n):
+        """ Show 'n' as the file count, unless it is already shown """
+        if n != self._file_count_shown:
+            self.file_count.config(text="File count: " + str(n))
+            self._file_count_shown = n
+        return
+
+    def set_student_files(self, labels):
+        """
+        Replace the choices in the (once built) student file menu with
+        'labels' and choose the first one, or '' if there are none.
+        """
+        menu = self._student_menu
+        menu.delete(0, "end")
+        chosen_file = self.chosen_file
+        for label in labels:
+            menu.add_command(label=label,
+                             command=tk._setit(chosen_file, label))
+        chosen_file.set(labels[0] if labels else '')
+        return
+
     def update_selected_student(self):
-        import os.path
-        if self.active_letter_file is not None:
-            self.write_text(self.letter.get("1.0", "end-1c"),
-                            self.active_letter_file)
         who = self.chosen_file.get()
         if who == '' or self.codefiles is None or self.file_label is None or \
                 len(self.student_name) == 0:
+            self.save_letter()
+            self._shown_student = None
             self.current_code = '(no code)'
-            self.input.configure(state="normal")
-            self.input.delete(1.0, tk.END)
-            self.input.insert(tk.END, self.current_code)
-            self.input.configure(state="disabled")
-            self.input_analysis.configure(state="normal")
-            self.input_analysis.delete(1.0, tk.END)
-            self.input_analysis.insert(tk.END, "(no analysis)")
-            self.input_analysis.configure(state="disabled")
-            self.messages.configure(state='normal')
-            self.messages.delete(1.0, tk.END)
-            self.messages.insert(tk.END, "(no messages)")
-            self.messages.configure(state='disabled')
-            self.output.configure(state="normal")
-            self.output.delete(1.0, tk.END)
-            self.output.insert(tk.END, "(no output)")
-            self.output.configure(state="disabled")
-            self.output_analysis.configure(state="normal")
-            self.output_analysis.delete(1.0, tk.END)
-            self.output_analysis.insert(tk.END, "(no analysis)")
-            self.output_analysis.configure(state="disabled")
-            self.letter.delete(1.0, tk.END)
-            self.letter.insert(tk.END, "(no analysis)")
+            set_ro_text = self.set_ro_text
+            for (tab, placeholder) in self._resettable:
+                set_ro_text(tab, placeholder)
+            self.set_text('letter', "(no analysis)")
             self.active_letter_file = None
             return
 
-        student_index = self.file_label.index(who)
+        student_index = self.file_label_index[who]
+        # Setting 'chosen_file' to the file already shown changes nothing
+        shown = (self.dir, self.fullname[student_index])
+        if shown == self._shown_student:
+            return
+        self.save_letter()
+        self._shown_student = shown
         sandbox = self.get_dir_name(student_index)
         fname = os.path.join(sandbox, self.versioned_filename[student_index])
         self.current_code = self.get_text_and_put_in_tab(
-            self.fullname[student_index], self.input, "(no input)",
+            self.fullname[student_index], 'input', "(no input)",
             disabled=True)
-        self.get_text_and_put_in_tab(fname + "pre", self.input_analysis,
+        self.get_text_and_put_in_tab(fname + "pre", 'input_analysis',
                                      "(no analysis)", disabled=True)
-        self.get_text_and_put_in_tab(fname + "msg", self.messages,
+        self.get_text_and_put_in_tab(fname + "msg", 'messages',
                                      "(no messages)", disabled=True)
-        self.get_text_and_put_in_tab(fname + "out", self.output,
+        self.get_text_and_put_in_tab(fname + "out", 'output',
                                      "(no output)", disabled=True)
-        self.get_text_and_put_in_tab(fname + "pst", self.output_analysis,
+        self.get_text_and_put_in_tab(fname + "pst", 'output_analysis',
                                      "(no analysis)", disabled=True)
         self.active_letter_file = fname + "ltr"
-        self.get_text_and_put_in_tab(self.active_letter_file, self.letter,
+        self.get_text_and_put_in_tab(self.active_letter_file, 'letter',
                                      "(no letter)", disabled=False)
+        self._letter_saved_text = self.get_tab_text('letter')
         return
 
     def update_gui(self, new_codefiles, new_codefile_files):
@@ -728,13 +901,10 @@ class AutoGrader(ttk.Frame):
         general configuration file.
         Stores list or None in self.codefiles.
         """
-        import re
-        import os
-        import time
         file_list = self.general_config['codefiles'].split(",")
         file_list = [f.strip() for f in file_list]
-        ok_re = re.compile(".+[.](R|Rmd|RRmd|sas|py)$", re.IGNORECASE)
-        files_ok = [ok_re.search(s) is not None for s in file_list]
+        files_ok = [s.lower().endswith(_CODEFILE_EXTS) and s.rfind(".") > 0
+                    for s in file_list]
         star_cnt = sum(["*" in f for f in file_list])
         bad_stars = star_cnt > 1 or (star_cnt == 1 and len(files_ok) > 1)
         if not all(files_ok) or bad_stars:
@@ -750,12 +920,14 @@ class AutoGrader(ttk.Frame):
         # Expand *.(R|Rmd|RRmd)" to all files (modulo student name, etc.)
         # according to the general configuration 'file_format'.
         star_ext = file_list[0][2:]
-        isOKext_re = re.compile(".+[.](R|Rmd|sas|py)$", re.IGNORECASE) if \
-            star_ext == "RRmd" else \
-            re.compile(".+[.]" + star_ext + "$", re.IGNORECASE)
-        all_files = os.listdir()
-        OK_files = [isOKext_re.search(f) for f in all_files]
-        OK_files = [x.group(0) for x in OK_files if x is not None]
+        star_exts = _RRMD_STAR_EXTS if star_ext == "RRmd" else \
+            ("." + star_ext.lower(),)
+        # Hidden files (e.g., "._Prob1.R" from macOS) and directories are
+        # skipped; is_file() uses the directory listing without a stat call.
+        with os.scandir(".") as entries:
+            OK_files = [e.name for e in entries
+                        if not e.name.startswith(".") and
+                        e.name.lower().endswith(star_exts) and e.is_file()]
         all_matches = [self.parse_one_filename(f)['filename']
                        for f in OK_files]
         all_matches = [re.sub("[.]r", ".R", x) for x in all_matches]
@@ -776,6 +948,149 @@ class AutoGrader(ttk.Frame):
         self.codefiles = file_list
         return
 
+    def cached_re(self, pattern, flags=0):
+        """
+        Return the compiled regular expression for 'pattern' and 'flags',
+        compiling it only the first time it is requested.
+        """
+        key = (pattern, flags)
+        compiled = self._regex_memo.get(key)
+        if compiled is None:
+            compiled = self._regex_memo[key] = re.compile(pattern, flags)
+        return compiled
+
+    def req_prohib_entries(self, config, item):
+        """
+        Return the non-blank lines of required or prohibited text item
+        'item' (e.g., 'req_output') of 'config' as (points, line, matcher,
+        regex, message) tuples, where matcher(text) is true if the line is
+        found in 'text' (exactly if quoted; otherwise 'regex' is its
+        compiled regular expression), and 'message' is the analysis line
+        for missing required or present prohibited text.
+        'matcher' is None for an invalid regular expression.
+        The result is cached until the config is modified or replaced.
+        """
+        key = (self.codefile + ".config", item)
+        mod_time = config.get('config_mod_time')
+        cached = self._req_prohib_cache.get(key)
+        if cached is not None and cached[0] is config and \
+                cached[1] == mod_time:
+            return cached[2]
+        (kind, code_or_output) = item.split('_', 1)
+        entries = []
+        for line in config[item].split('\n'):
+            line = line.strip()
+            if len(line) == 0:
+                continue
+            (points, line) = self.pull_off_points(line)
+            regex = None
+            if line[0] == line[-1] and line[0] in "\"'":
+                if len(line) < 3:
+                    continue
+                matcher = lambda t, s=line[1:-2]: s in t  # noqa: E731
+            else:
+                try:
+                    regex = re.compile(line)
+                    matcher = regex.search
+                except re.error:
+                    matcher = None
+            if kind == 'req':
+                if points is None:
+                    message = "Missing output: " + line + "\n"
+                else:
+                    adj = "missing" if points < 0.0 else "avoided"
+                    message = str(points) + " points for " + adj + " " + \
+                        code_or_output + ": " + line + "\n"
+            else:
+                if points is None:
+                    message = "Prohibited output: " + line + "\n"
+                elif points < 0.0:
+                    message = str(points) + " points for prohibited " + \
+                        "output: " + line + "\n"
+                else:
+                    message = str(points) + " extra credit points for " + \
+                        "output: " + line + "\n"
+            entries.append((points, line, matcher, regex, message))
+        self._req_prohib_cache[key] = (config, mod_time, entries)
+        return entries
+
+    def warning_ignore_re(self, config):
+        """
+        Return the compiled alternation of SAS warnings to ignore: registry
+        customizations plus the config's 'dropped_messages' lines.
+        The result is cached until the config is modified or replaced.
+        """
+        key = self.codefile + ".config"
+        mod_time = config.get('config_mod_time')
+        cached = self._warning_ignore_cache.get(key)
+        if cached is not None and cached[0] is config and \
+                cached[1] == mod_time:
+            return cached[2]
+        # extend ignore to 'dropped_messages' (4/24/2018)
+        ignore_text = "registry customizations"
+        dropped_messages = config['dropped_messages'].strip()
+        if len(dropped_messages) > 0:
+            ignore_text = "|".join([ignore_text] +
+                                   dropped_messages.split('\n'))
+        ignore_re = re.compile(ignore_text)
+        self._warning_ignore_cache[key] = (config, mod_time, ignore_re)
+        return ignore_re
+
+    def fused_re(self, config, item):
+        """
+        Return (regex, group_map) where 'regex' is a single alternation of
+        the regular expressions in config[item] and 'group_map' maps the
+        group number of each alternative to its line.  The result is
+        cached until the config is modified or replaced.
+        (None, None) is returned if the lines cannot be combined.
+        """
+        key = (self.codefile + ".config", item)
+        mod_time = config.get('config_mod_time')
+        cached = self._fused_memo.get(key)
+        if cached is not None and cached[0] is config and \
+                cached[1] == mod_time:
+            return cached[2]
+        fused = (None, None)
+        entries = [(entry[1], entry[3]) for entry in
+                   self.req_prohib_entries(config, item)
+                   if entry[3] is not None]
+        if len(entries) > 0:
+            try:
+                group_map = {}
+                parts = []
+                group = 1
+                for (line, regex) in entries:
+                    if _UNFUSABLE_RE.search(line) is not None:
+                        raise re.error("cannot fuse " + line)
+                    group_map[group] = line
+                    group += regex.groups + 1
+                    parts.append("(" + line + ")")
+                fused = (re.compile("|".join(parts)), group_map)
+            except re.error:
+                pass
+        self._fused_memo[key] = (config, mod_time, fused)
+        return fused
+
+    def fused_search(self, config, item, text):
+        """
+        Scan 'text' once for all regular expressions in config[item].
+        Return (found, exhaustive), where 'found' is the set of lines
+        seen and 'exhaustive' is True when the other lines are known to
+        be absent, or (None, False) if the lines cannot be combined.
+        """
+        (regex, group_map) = self.fused_re(config, item)
+        if regex is None:
+            return (None, False)
+        found = set()
+        wanted = len(set(group_map.values()))
+        for match in regex.finditer(text):
+            found.add(group_map[match.lastindex])
+            if len(found) == wanted:
+                break
+        # A pattern hidden by an earlier alternative matching at the same
+        # place is only known to be absent if nothing matched at all.
+        return (found, len(found) == 0 or len(found) == wanted)
+
     def parse_one_filename(self, name):
         """
         Convert a filename into a dictionary with elements 'filename' (with
@@ -791,9 +1106,6 @@ class AutoGrader(ttk.Frame):
         'name': (str) a "segemented" file name according to 'file_format'
                 specifed by the user in the general configuration.
         """
-        import re
-        re_dotExt = re.compile("(.+)([.][a-zA-Z]+$)")
-        re_version = re.compile("(.+)(-[0-9]{1,2}$)")
 
         fmt_n = len(self.file_format_items)
         parts = name.split(self.filename_separator)
@@ -831,19 +1143,22 @@ class AutoGrader(ttk.Frame):
             elif field == "%e":
                 rtn['email'] = value
             else:  # field == "%f": extract version and base filename
-                dot_srch = re_dotExt.search(value)
-                if dot_srch is None:
+                dot = value.rfind(".")
+                ext = value[dot + 1:]
+                if dot < 1 or not (ext.isascii() and ext.isalpha()):
                     messagebox.showwarning("No extention",
                                            name + " has no extention")
                     self.on_quit()
-                ext = dot_srch.group(2)
-                fname = dot_srch.group(1)
-                vers_srch = re_version.search(fname)
-                if vers_srch is None:
+                    return rtn
+                fname = value[:dot]
+                dash = fname.rfind("-")
+                vers = fname[dash + 1:]
+                if dash < 1 or len(vers) > 2 or \
+                        not (vers.isascii() and vers.isdigit()):
                     rtn['filename'] = value
                 else:
-                    rtn['filename'] = vers_srch.group(1) + ext
-                    rtn['version'] = int(vers_srch.group(2)[1:])
+                    rtn['filename'] = fname[:dash] + value[dot:]
+                    rtn['version'] = int(vers)
         return rtn
 
     def parse_codefile_names(self, names):
@@ -859,9 +1174,25 @@ class AutoGrader(ttk.Frame):
         self.student_name = []
         self.email = []
         self.file_label = []
+        self.file_label_index = {}
+        self.duplicate_labels = set()
         if names is None:
             return
 
+        # Dictionaries from value to (first) list position replace repeated
+        # list.count() / list.index() scans
+        roster_ok = self.roster_email is not None and \
+            self.roster_fullname is not None
+        if roster_ok:
+            roster_name_loc = {
+                n: i for (i, n) in
+                reversed(list(enumerate(self.roster_fullname)))}
+            roster_email_loc = {
+                e: i for (i, e) in
+                reversed(list(enumerate(self.roster_email)))}
+        name_loc = {}
+        email_loc = {}
+
         # Process each filename
         for index in range(len(names)):
             fname = names[index]
@@ -873,22 +1204,16 @@ class AutoGrader(ttk.Frame):
             filename = elements['filename']
             # add in email if needed and possible
             if elements['student_name'] != '' and \
-                    elements['email'] == '' and \
-                    self.roster_email is not None and \
-                    self.roster_fullname is not None:
-                cnt = self.roster_fullname.count(sname)
-                if cnt > 0:
-                    loc = self.roster_fullname.index(sname)
+                    elements['email'] == '' and roster_ok:
+                loc = roster_name_loc.get(sname, -1)
+                if loc >= 0:
                     elements['email'] = self.roster_email[loc]
                     email = elements['email']
             # add in student if needed and possible
             if elements['email'] != '' and \
-                    elements['student_name'] == '' and \
-                    self.roster_fullname is not None and \
-                    self.roster_email is not None:
-                cnt = self.roster_email.count(email)
-                if cnt > 0:
-                    loc = self.roster_email.index(email)
+                    elements['student_name'] == '' and roster_ok:
+                loc = roster_email_loc.get(email, -1)
+                if loc >= 0:
                     elements['student_name'] = self.roster_fullname[loc]
                     sname = elements['student_name']
             # Set file label (for "dropdown" list of files)
@@ -906,17 +1231,9 @@ class AutoGrader(ttk.Frame):
             # Check if this is a different version of a file already
             # in the list
             if sname != '':
-                cnt = self.student_name.count(sname)
-                if cnt == 0:
-                    loc = -1
-                else:
-                    loc = self.student_name.index(sname)
+                loc = name_loc.get(sname, -1)
             else:
-                cnt = self.email.count(email)
-                if cnt == 0:
-                    loc = -1
-                else:
-                    loc = self.email.index(email)
+                loc = email_loc.get(email, -1)
 
             # Make versioned filenam
             if elements['version'] == 0:
@@ -926,6 +1243,9 @@ class AutoGrader(ttk.Frame):
                 vfn = filename[:len(filename)-len(ext)] + "-" + \
                     str(elements['version']) + ext
             if loc == -1:
+                name_loc.setdefault(elements['student_name'],
+                                    len(self.student_name))
+                email_loc.setdefault(elements['email'], len(self.email))
                 self.fullname.append(fname)
                 self.filename.append(elements['filename'])
                 self.version.append(elements['version'])
@@ -935,6 +1255,8 @@ class AutoGrader(ttk.Frame):
                 self.email.append(elements['email'])
                 self.file_label.append(file_label)
             elif self.version[loc] < elements['version']:
+                name_loc.setdefault(elements['student_name'], loc)
+                email_loc.setdefault(elements['email'], loc)
                 self.fullname[loc] = fname
                 self.filename[loc] = elements['filename']
                 self.version[loc] = elements['version']
@@ -943,6 +1265,15 @@ class AutoGrader(ttk.Frame):
                 self.student_name[loc] = elements['student_name']
                 self.email[loc] = elements['email']
                 self.file_label[loc] = file_label
+        self.file_label_index = {label: i for (i, label) in
+                                 reversed(list(enumerate(self.file_label)))}
+        self.duplicate_labels = set()
+        if len(self.file_label_index) != len(self.file_label):
+            seen = set()
+            for label in self.file_label:
+                if label in seen:
+                    self.duplicate_labels.add(label)
+                seen.add(label)
         return
 
     def get_student_files(self, forceFirst):
@@ -952,8 +1283,6 @@ class AutoGrader(ttk.Frame):
         Main effect is to use parse_codefile_names to fill in self.fullname,
         self.email, self.student_name, etc.
         """
-        import os
-        import re
         if self.codefiles is None:
             self.parse_codefile_names(None)
             return
@@ -965,19 +1294,31 @@ class AutoGrader(ttk.Frame):
         parts = self.codefiles[index].split(".")
         if len(parts) > 2:
             parts = (".".join(parts[:-1]), parts[-1])
-        codefile_re = re.compile(self.filename_separator + parts[0] +
-                                 "(-[0-9]{1,2})?" + "." + parts[1] + "$",
-                                 re.IGNORECASE)
-        for file in os.listdir(self.dir):
+        codefile_re = self.cached_re(self.filename_separator + parts[0] +
+                                     "(-[0-9]{1,2})?" + "." + parts[1] + "$",
+                                     re.IGNORECASE)
+        for file in self.list_dir(self.dir):
             if codefile_re.search(file) is not None:
                 rtn.append(file)
         self.parse_codefile_names(rtn)
         return
 
+    def list_dir(self, directory):
+        """
+        Return the file names in 'directory', reusing the previous listing
+        if the directory's modification time and size have not changed since
+        then.  On file systems with coarse timestamps (e.g., 2 s on FAT), a
+        file added or removed within the same tick without changing the
+        directory size is missed until the directory is modified again.
+        """
+        st = os.stat(directory)
+        key = (os.path.abspath(directory), st.st_mtime_ns, st.st_size)
+        if self._dir_snapshot is None or self._dir_snapshot[0] != key:
+            self._dir_snapshot = (key, os.listdir(directory))
+        return self._dir_snapshot[1]
+
     def on_quit(self):
-        if self.active_letter_file is not None:
-            self.write_text(self.letter.get("1.0", "end-1c"),
-                            self.active_letter_file)
+        self.save_letter()
         self.master.destroy()
         self.quit()
 
@@ -992,23 +1333,21 @@ class AutoGrader(ttk.Frame):
         return
 
     def new_dir(self, dir):
-        from os import chdir
         self.dir = dir
         self.root.title('R Grader: ' + dir)
-        chdir(dir)
+        os.chdir(dir)
         self.setup_for_new_dir()
         self.update_gui(new_codefiles=True, new_codefile_files=True)
         return
 
     def f_path(self, fname, add_dir=False):
         """ Construct file path based on self.dir and self.file.common_len """
-        from os.path import join
         in_type = 'list'
         if type(fname) is not list:
             in_type = 'not list'
             fname = [fname]
         if add_dir:
-            fname = [join(self.dir, f) for f in fname]
+            fname = [os.path.join(self.dir, f) for f in fname]
         if in_type == 'not list':
             fname = fname[0]
         return fname
@@ -1021,36 +1360,91 @@ class AutoGrader(ttk.Frame):
         return fname[period:]
 
     def run_all(self, who=None):
-        import os
-        import os.path
+        """
+        Run every student file whose output is older than the file or the
+        codefile's specific configuration.  The submitted code is run by
+        parallel worker threads (which just wait on the external programs);
+        the analyses and letters are produced here, in the GUI thread, as
+        each run finishes.
+        """
         if len(self.file_label) != 0 and self.file_label[0] != '':
             config = self.specific_configs[self.codefile + ".config"]
             config_time = config['config_mod_time']
-            for who in self.file_label:
-                student_index = self.file_label.index(who)
-                input_mod_time = os.path.getmtime(self.fullname[student_index])
+            jobs = []
+            # Directory entries carry (on Windows, cached) stat information
+            dir_entries = self.scan_dir(self.dir)
+            sandbox_entries = {}
+            for (student_index, who) in enumerate(self.file_label):
+                fullname = self.fullname[student_index]
+                if fullname in dir_entries:
+                    input_mod_time = dir_entries[fullname].stat().st_mtime
+                else:
+                    input_mod_time = os.path.getmtime(fullname)
                 sandbox = self.get_dir_name(student_index)
+                if sandbox not in sandbox_entries:
+                    sandbox_entries[sandbox] = self.scan_dir(sandbox)
                 outname = self.versioned_filename[student_index] + "out"
-                outfile = os.path.join(sandbox, outname)
-                if os.access(outfile, os.R_OK):
-                    last_run_time = os.path.getmtime(outfile)
+                out_entry = sandbox_entries[sandbox].get(outname)
+                if out_entry is not None:
+                    last_run_time = out_entry.stat().st_mtime
                 else:
                     last_run_time = -1.0
                 if last_run_time < input_mod_time or \
                         last_run_time < config_time:
-                    self.run_one(who)
+                    job = self.start_run(who)
+                    if job is not None:
+                        jobs.append(job)
+
+            to_run = [job for job in jobs if job['runstring'] is not None]
+            if len(to_run) > 0:
+                with concurrent.futures.ThreadPoolExecutor(
+                        max_workers=min(8, os.cpu_count() or 1)) as executor:
+                    futures = {executor.submit(run_in_sandbox,
+                                               job['runstring'],
+                                               job['sandbox_path']): job
+                               for job in to_run}
+                    for future in concurrent.futures.as_completed(futures):
+                        self.finish_run(futures[future], future.result())
+            for job in jobs:
+                if job['runstring'] is None:
+                    self.finish_run(job, None)
         return
 
+    def scan_dir(self, directory):
+        """
+        Return a dictionary of the os.DirEntry objects in 'directory' keyed
+        by name (empty if the directory cannot be read).
+        """
+        try:
+            with os.scandir(directory) as entries:
+                return {entry.name: entry for entry in entries}
+        except OSError:
+            return {}
+
     def run_one(self, who=None):
-        import os
-        import os.path
+        """ Run and analyze one student file ('who' defaults to chosen) """
+        job = self.start_run(who)
+        if job is None:
+            return
+        returncode = None
+        if job['runstring'] is not None:
+            returncode = run_in_sandbox(job['runstring'], job['sandbox_path'])
+        self.finish_run(job, returncode)
+        return
+
+    def start_run(self, who=None):
+        """
+        Prepare to run one student file: create the sandbox, set up a blank
+        letter, pre-analyze the code, and write the code to be run.
+        Returns a dictionary describing the pending run (or None on error)
+        for use with run_in_sandbox() and finish_run().
+        """
         if who is None:
             who = self.chosen_file.get()
-        c = self.file_label.count(who)
-        if c != 1:
+        student_index = self.file_label_index.get(who)
+        if student_index is None or who in self.duplicate_labels:
             messagebox.showwarning("Programmer error", "run_one error")
-            return
-        student_index = self.file_label.index(who)
+            return None
         if who == self.chosen_file.get():
             current_code = self.current_code + "\n"
         else:
@@ -1064,14 +1458,15 @@ class AutoGrader(ttk.Frame):
             except OSError:
                 messagebox.showwarning("Cannot create sandbox",
                                        "Failed to create " + sandbox)
-                return
+                return None
 
         # Setup blank letter
         codefile = self.versioned_filename[student_index]
-        self.active_letter_file = os.path.join(sandbox, codefile + "ltr")
+        letter_file = os.path.join(sandbox, codefile + "ltr")
+        self.active_letter_file = letter_file
         if who == self.chosen_file.get():
-            self.letter.delete(1.0, tk.END)
-        self.write_text('(no letter)', self.active_letter_file)
+            self.set_text('letter', '')
+        self.write_text('(no letter)', letter_file)
         config = self.specific_configs[self.codefile + ".config"]
         total_points = config['total_points']
         if total_points <= 0:
@@ -1081,24 +1476,46 @@ class AutoGrader(ttk.Frame):
         (pre_analysis_points, pre_analysis_points_text) = \
             self.pre_analyze(current_code, sandbox, student_index)
 
-        # Analysis
-        self.submit_code(current_code, sandbox, student_index)
+        # Setup for analysis
+        (runstring, output_name) = \
+            self.prepare_submission(current_code, sandbox, student_index)
+
+        return {'student_index': student_index, 'sandbox': sandbox,
+                'sandbox_path': os.path.join(self.dir, sandbox),
+                'codefile': codefile, 'letter_file': letter_file,
+                'total_points': total_points,
+                'pre_analysis_points': pre_analysis_points,
+                'pre_analysis_points_text': pre_analysis_points_text,
+                'runstring': runstring, 'output_name': output_name}
+
+    def finish_run(self, job, returncode):
+        """
+        Complete a run set up by start_run() after its code was run with
+        exit code 'returncode' (None if it could not be run): save the
+        output, post-analyze it, and write the letter.
+        """
+        self.active_letter_file = job['letter_file']
+        if returncode is not None:
+            self.finish_submission(returncode, job['output_name'])
 
         # Post-analysis
         (post_analysis_points, post_analysis_points_text) = \
-            self.post_analyze(sandbox, student_index)
+            self.post_analyze(job['sandbox'], job['student_index'])
 
         # Write letter
-        self.write_letter(codefile, total_points,
-                          pre_analysis_points, pre_analysis_points_text,
+        self.write_letter(job['codefile'], job['total_points'],
+                          job['pre_analysis_points'],
+                          job['pre_analysis_points_text'],
                           post_analysis_points, post_analysis_points_text)
-
+        # The tabs now hold this run's results, which need not be for the
+        # chosen student, so choosing a student must reload the tabs.
+        self._shown_student = None
         return
 
     def pull_off_points(self, line):
         """ Given text optionally preceeded by "{myPoints}", return
             myPoints and the cleaned text. """
-        temp = self.re_points.search(line)
+        temp = _POINTS_RE.search(line)
         if temp is None:
             points = None
         else:
@@ -1112,37 +1529,36 @@ class AutoGrader(ttk.Frame):
 
     def pre_analyze(self, text, sandbox, index):
         """ Analyze submitted code before running it """
-        import re
-        import os.path
         codefile = self.codefile
         ext = self.get_extension(codefile).upper()
         config = self.specific_configs[codefile + ".config"]
-        result = ''
-        points_text = ''
+        result = []
         points_docked = 0.0
         textx = text.split("\n")
 
         # Define comments for current programming language
         if ext in ('.R', '.RMD', '.PY'):
-            re_comment = re.compile("^\\s*#")
+            re_comment = _HASH_COMMENT_RE
         elif ext == '.SAS':
-            re_comment = re.compile("^\\s*[/][*]")
+            re_comment = _SAS_COMMENT_RE
         else:
             messagebox.showwarning("Programmer error", "in pre_analyze")
-        comment_count = sum([re_comment.search(s) is not None for s in textx])
-        result += "Desired / actual comments = " + \
-                  str(config['min_comments']) + " / " + \
-                  str(comment_count) + "\n"
-
-        re_blank = re.compile("^\\s*$")
-        blank_count = sum([re_blank.match(s) is not None for s in textx])
-        result += "Desired / actual blanks = " + str(config['min_blanks']) + \
-                  " / " + str(blank_count) + "\n\n"
+        search = re_comment.search
+        comment_count = sum(1 for s in textx if search(s))
+        result.append("Desired / actual comments = " +
+                      str(config['min_comments']) + " / " +
+                      str(comment_count) + "\n")
+
+        match = _BLANK_RE.match
+        blank_count = sum(1 for s in textx if match(s))
+        result.append("Desired / actual blanks = " +
+                      str(config['min_blanks']) + " / " +
+                      str(blank_count) + "\n\n")
 
         # Handle required and prohibited text
-        (pts, temp) = self.req_and_prohib(config, text, "code")
-        result += temp
-        points_text += temp
+        (pts, points_text) = self.req_and_prohib(config, text, "code")
+        result.append(points_text)
+        result = "".join(result)
         if pts is not None:
             points_docked += pts
 
@@ -1150,25 +1566,15 @@ class AutoGrader(ttk.Frame):
         pre = os.path.join(sandbox, self.versioned_filename[index] + "pre")
         self.write_text(result, pre)
         if self.file_label[index] == self.chosen_file.get():
-            self.input_analysis.configure(state="normal")
-            self.input_analysis.delete(1.0, tk.END)
-            self.input_analysis.insert(tk.END, result)
-            self.input_analysis.configure(state="disabled")
+            self.set_ro_text('input_analysis', result)
 
         return (points_docked, points_text)
 
-    def multi_drop(self, lst, todrop):
-        """ remove elements 'todrop' from list 'list' """
-        for i in sorted(todrop, reverse=True):
-            del lst[i]
-        return lst
-
     def post_analyze(self, sandbox, index):
-        import os.path
         codefile = self.versioned_filename[index]
         ext = self.get_extension(codefile).upper()
         outfile = os.path.join(sandbox, codefile + "out")
-        text = self.get_text_and_put_in_tab(outfile, self.output,
+        text = self.get_text_and_put_in_tab(outfile, 'output',
                                             "(no output)", disabled=True,
                                             SAS=(ext == ".SAS"))
         if text is None:
@@ -1179,8 +1585,8 @@ class AutoGrader(ttk.Frame):
             fail_text = "Analysis of " + codefile + " awards " + \
                         "zero points because no output was produced."
             self.write_text(fail_text, self.active_letter_file)
-            self.letter.delete(1.0, tk.END)
-            self.letter.insert(tk.END, fail_text)
+            self.set_text('letter', fail_text)
+            self._letter_saved_text = fail_text
             return (0, '')
 
         config = self.specific_configs[self.codefile + ".config"]
@@ -1206,92 +1612,49 @@ class AutoGrader(ttk.Frame):
     def R_post_analyze(self, sandbox, codefile, outfile, text, config,
                        file_label):
         """ Analyze results from submitting R code """
-        import re
-        import os.path
 
         textx = text.split("\n")
-        out_analysis = ''
-        messages = ''
-        points_text = ''
+        out_analysis = []
         points_docked = 0.0
         # letter = 'You did a pretty good job.'
-        re_warning = re.compile("^Warning message:")
-        re_error = re.compile("^(Error in|Error:)")
 
         # Look for error messages
-        error_line_nums = [num for (num, txt) in enumerate(textx) if
-                           re_error.search(txt) is not None]
-        error_count = len(error_line_nums)
-        if error_count == 0:
-            error_lines = None
-        else:
-            error_lines = ["@ " + str(i) + " " + textx[i] + "\n" + textx[i+1]
-                           for i in error_line_nums]
-            # Remove benign "package built" errors
-            ignore_re = re.compile("package .* was built under R version")
-            ignore_nums = [num for (num, txt) in enumerate(error_lines)
-                           if ignore_re.search(txt) is not None]
-            error_lines = self.multi_drop(error_lines, ignore_nums)
-            error_count = len(error_lines)
-            if len(error_lines) == 0:
-                error_lines = None
-        # Prepare to add errors to "messages" tab
-        if error_count > 0:
-            messages += "**** ERRORS ****\n"
-            for line in error_lines:
-                messages += line + "\n"
-        temp = "Allowed / actual errors = " + \
-               str(config['max_errors']) + " / " + \
-               str(error_count) + "\n"
-        out_analysis += temp
-        points_text += temp
+        error_line_nums = self.match_line_numbers(_R_ERROR_RE, text)
+        error_lines = []
+        for i in error_line_nums:
+            temp = "@ " + str(i) + " " + "\n".join(textx[i:i+2])
+            # Skip benign "package built" errors
+            if _R_IGNORE_RE.search(temp) is None:
+                error_lines.append(temp)
+        error_count = len(error_lines)
+        out_analysis.append("Allowed / actual errors = " +
+                            str(config['max_errors']) + " / " +
+                            str(error_count) + "\n")
 
         # Look for warning messages
-        warning_line_nums = [num for (num, txt) in enumerate(textx) if
-                             re_warning.search(txt) is not None]
-        warning_count = len(warning_line_nums)
-        if warning_count == 0:
-            warning_lines = None
-        else:
+        warning_line_nums = self.match_line_numbers(_R_WARNING_RE, text)
+        warning_lines = []
+        for i in warning_line_nums:
             # Warning lines may span multiple lines (allow up to 4)
-            len_t = len(textx)
-            warning_lines = []
-            for i in warning_line_nums:
-                temp = "@ " + str(i) + " "
-                if len_t > i + 1 and len(textx[i+1]) > 0 and \
-                        textx[i+1][0] != ">":
-                    temp += textx[i+1] + "\n"
-                    if len_t > i + 2 and len(textx[i+2]) > 0 and \
-                            textx[i+2][0] != ">":
-                        temp += textx[i+2] + "\n"
-                        if len_t > i + 3 and len(textx[i+3]) > 0 and \
-                                textx[i+3][0] != ">":
-                            temp += textx[i+3] + "\n"
+            temp = ["@ " + str(i) + " "]
+            for more in message_tail(textx[i+1:i+4], ">".__eq__):
+                temp.append(more + "\n")
+            temp = "".join(temp)
+            # Skip benign "package built" warnings
+            if _R_IGNORE_RE.search(temp) is None:
                 warning_lines.append(temp)
-            ignore_re = re.compile("package .* was built under R version")
-            ignore_nums = [num for (num, txt) in enumerate(warning_lines)
-                           if ignore_re.search(txt) is not None]
-            warning_lines = self.multi_drop(warning_lines, ignore_nums)
-            warning_count = len(warning_lines)
-            if len(warning_lines) == 0:
-                warning_lines = None
-        if warning_count > 0:
-            if error_count > 0:
-                messages += "\n"
-            messages += "**** WARNINGS ****\n"
-            for line in warning_lines:
-                messages += line + "\n"
-        temp = "Allowed / actual warnings = " + \
-               str(config['max_warnings']) + " / " + \
-               str(warning_count) + "\n"
-        out_analysis += temp
-        points_text += temp
+        warning_count = len(warning_lines)
+        out_analysis.append("Allowed / actual warnings = " +
+                            str(config['max_warnings']) + " / " +
+                            str(warning_count) + "\n")
 
         (pts, temp) = self.req_and_prohib(config, text, "output")
-        out_analysis += temp
-        points_text += temp
+        out_analysis.append(temp)
         if pts is not None:
             points_docked += pts
+        # All of the output analysis counts toward the points text
+        points_text = out_analysis = "".join(out_analysis)
+        messages = "".join(self.render_issues(error_lines, warning_lines))
 
         # Save and display messages and post-analysis
         if messages == '':
@@ -1304,147 +1667,133 @@ class AutoGrader(ttk.Frame):
         self.write_text(out_analysis, pst)
         # self.write_text(letter, self.active_letter_file)
         if file_label == self.chosen_file.get():
-            self.messages.configure(state='normal')
-            self.messages.delete(1.0, tk.END)
-            self.messages.insert(tk.END, messages)
-            self.messages.configure(state='disabled')
-            self.output_analysis.configure(state="normal")
-            self.output_analysis.delete(1.0, tk.END)
-            self.output_analysis.insert(tk.END, out_analysis)
-            self.output_analysis.configure(state="disabled")
+            self.set_ro_text('messages', messages)
+            self.set_ro_text('output_analysis', out_analysis)
             # self.letter.delete(1.0, tk.END)
             # self.letter.insert(tk.END, letter)
         return (points_docked, points_text)
 
+    def match_line_numbers(self, regex, text):
+        """
+        Return the (zero-based) numbers of the lines of 'text' on which
+        're.MULTILINE' regular expression 'regex' matches, using one scan
+        of the whole text rather than a search of each line.
+        """
+        line_nums = []
+        line_num = 0
+        pos = 0
+        for match in regex.finditer(text):
+            line_num += text.count("\n", pos, match.start())
+            pos = match.start()
+            if len(line_nums) == 0 or line_nums[-1] != line_num:
+                line_nums.append(line_num)
+        return line_nums
+
+    def collect_SAS_issues(self, logfile, config):
+        """
+        Return lists of the (non-ignored) error and warning messages in SAS
+        log file 'logfile', each as "@ line# " and the message text.
+        The log is scanned as bytes; only the messages are decoded.
+        """
+        warning_ignore_re = self.warning_ignore_re(config)
+        # Look for error and warning messages in one pass over the log,
+        # streaming it rather than holding the whole log in memory
+        error_lines = []
+        warning_lines = []
+        for (i, window) in \
+                enumerate(with_lookahead(self.get_byte_lines(logfile), 3)):
+            line = window[0]
+            # Most lines are neither, so test for both at once first
+            if not line.startswith(_SAS_MESSAGE_STARTS):
+                continue
+            if line.startswith(b"ERROR:"):
+                temp = ["@ " + str(i) + " " +
+                        line.decode('utf-8', 'replace') + "\n"]
+                ends_message = bytes.isdigit
+                ignore_re = _SAS_IGNORE_RE
+                found = error_lines
+            else:
+                temp = ["@ " + str(i) + " "]
+                ends_message = b">".__eq__
+                ignore_re = warning_ignore_re
+                found = warning_lines
+            # Messages may continue on up to 3 more lines
+            for more in message_tail(itertools.islice(window, 1, None),
+                                     ends_message):
+                temp.append(more.decode('utf-8', 'replace') + "\n")
+            temp = "".join(temp)
+            # Skip benign errors and dropped warnings
+            if ignore_re.search(temp) is None:
+                found.append(temp)
+        return (error_lines, warning_lines)
+
+    def render_issues(self, error_lines, warning_lines):
+        """
+        Return the "messages" tab text for lists of error and warning
+        messages, as a list of strings (empty if there are none).
+        """
+        messages = []
+        if len(error_lines) > 0:
+            messages.append("**** ERRORS ****\n")
+            for line in error_lines:
+                messages.append(line + "\n")
+        if len(warning_lines) > 0:
+            if len(error_lines) > 0:
+                messages.append("\n")
+            messages.append("**** WARNINGS ****\n")
+            for line in warning_lines:
+                messages.append(line + "\n")
+        return messages
+
     def SAS_post_analyze(self, sandbox, codefile, outfile, text, config,
                          file_label):
         """ Analyze results from submitting SAS code """
-        import re
-        import os.path
 
         # textx = text.split("\n")
-        log = self.get_text(os.path.join(sandbox, codefile + "log"))
-        logx = log.split("\n")
-        out_analysis = ''
-        messages = ''
+        logfile = os.path.join(sandbox, codefile + "log")
+        out_analysis = []
         points_docked = 0.0
-        points_text = ''
         # letter = 'You did a pretty good job.'
-        re_warning = re.compile("^WARNING:")
-        re_error = re.compile("^ERROR:")
-
-        # Look for error messages
-        error_line_nums = [num for (num, txt) in enumerate(logx) if
-                           re_error.search(txt) is not None]
-        error_count = len(error_line_nums)
-        if error_count == 0:
-            error_lines = None
-        else:
-            len_t = len(logx)
-            error_lines = []
-            for i in error_line_nums:
-                temp = "@ " + str(i) + " " + logx[i] + "\n"
-                if len_t > i + 1 and len(logx[i+1]) > 0 and \
-                        logx[i+1][0] not in "0123456789":
-                    temp += logx[i+1] + "\n"
-                    if len_t > i + 2 and len(logx[i+2]) > 0 and \
-                            logx[i+2][0] not in "0123456789":
-                        temp += logx[i+2] + "\n"
-                        if len_t > i + 3 and len(logx[i+3]) > 0 and \
-                                logx[i+3][0] not in "0123456789":
-                            temp += logx[i+3] + "\n"
-                error_lines.append(temp)
-            ignore_re = re.compile("Errors printed on page")
-            ignore_nums = [num for (num, txt) in enumerate(error_lines)
-                           if ignore_re.search(txt) is not None]
-            error_lines = self.multi_drop(error_lines, ignore_nums)
-            error_count = len(error_lines)
-            if len(error_lines) == 0:
-                error_lines = None
-        if error_count > 0:
-            messages += "**** ERRORS ****\n"
-            for line in error_lines:
-                messages += line + "\n"
-        temp = "Allowed / actual errors = " + \
-               str(config['max_errors']) + " / " + \
-               str(error_count) + "\n"
-        out_analysis += temp
-        points_text += temp
 
-        # Look for warning messages
-        warning_line_nums = [num for (num, txt) in enumerate(logx) if
-                             re_warning.search(txt) is not None]
-        warning_count = len(warning_line_nums)
-        if warning_count == 0:
-            warning_lines = None
-        else:
-            len_t = len(logx)
-            warning_lines = []
-            for i in warning_line_nums:
-                temp = "@ " + str(i) + " "
-                if len_t > i + 1 and len(logx[i+1]) > 0 and \
-                        logx[i+1][0] != ">":
-                    temp += logx[i+1] + "\n"
-                    if len_t > i + 2 and len(logx[i+2]) > 0 and \
-                            logx[i+2][0] != ">":
-                        temp += logx[i+2] + "\n"
-                        if len_t > i + 3 and len(logx[i+3]) > 0 and \
-                                logx[i+3][0] != ">":
-                            temp += logx[i+3] + "\n"
-                warning_lines.append(temp)
-            # extend ignore to 'dropped_messages' (4/24/2018)
-            ignore_text = "registry customizations"
-            dropped_messages = config['dropped_messages'].strip()
-            if len(dropped_messages) > 0:
-                ignore_text = "|".join([ignore_text] +
-                                       dropped_messages.split('\n'))
-            ignore_re = re.compile(ignore_text)
-            ignore_nums = [num for (num, txt) in enumerate(warning_lines)
-                           if ignore_re.search(txt) is not None]
-            warning_lines = self.multi_drop(warning_lines, ignore_nums)
-            warning_count = len(warning_lines)
-            if len(warning_lines) == 0:
-                warning_lines = None
-        if warning_count > 0:
-            if error_count > 0:
-                messages += "\n"
-            messages += "**** WARNINGS ****\n"
-            for line in warning_lines:
-                messages += line + "\n"
-        temp = "Allowed / actual warnings = " + \
-               str(config['max_warnings']) + " / " + \
-               str(warning_count) + "\n"
-        out_analysis += temp
-        points_text += temp
+        # Look for error and warning messages
+        (error_lines, warning_lines) = self.collect_SAS_issues(logfile,
+                                                               config)
+        error_count = len(error_lines)
+        warning_count = len(warning_lines)
+        messages = self.render_issues(error_lines, warning_lines)
+        out_analysis.append("Allowed / actual errors = " +
+                            str(config['max_errors']) + " / " +
+                            str(error_count) + "\n")
+        out_analysis.append("Allowed / actual warnings = " +
+                            str(config['max_warnings']) + " / " +
+                            str(warning_count) + "\n")
+        # Only the error and warning counts go into the points text
+        points_text = "".join(out_analysis)
 
         # Check for required and prohibited output
         (pts, temp) = self.req_and_prohib(config, text, "output")
-        out_analysis += temp
+        out_analysis.append(temp)
+        out_analysis = "".join(out_analysis)
         if pts is not None:
             points_docked += pts
 
         # Save and display messages and post-analysis
-        if messages == '':
-            messages = '(no warnings or errors)'
+        if len(messages) == 0:
+            messages = ['(no warnings or errors)']
         else:
-            messages += "\n********************************************\n"
-            messages += log
+            messages.append("\n" + "*" * 44 + "\n")
+            messages.append(self.get_text(logfile))
         if out_analysis == '':
             out_analysis = '(no output problems)'
         msg = os.path.join(sandbox, codefile + "msg")
-        self.write_text(messages, msg)
+        # The log is written after the messages, not joined to them
+        self.write_text_parts(messages, msg)
         pst = os.path.join(sandbox, codefile + "pst")
         self.write_text(out_analysis, pst)
         # self.write_text(letter, self.active_letter_file)
         if file_label == self.chosen_file.get():
-            self.messages.configure(state='normal')
-            self.messages.delete(1.0, tk.END)
-            self.messages.insert(tk.END, messages)
-            self.messages.configure(state='disabled')
-            self.output_analysis.configure(state='normal')
-            self.output_analysis.delete(1.0, tk.END)
-            self.output_analysis.insert(tk.END, out_analysis)
-            self.output_analysis.configure(state='disabled')
+            self.set_ro_text('messages', "".join(messages))
+            self.set_ro_text('output_analysis', out_analysis)
             # self.letter.delete(1.0, tk.END)
             # self.letter.insert(tk.END, letter)
         return (points_docked, points_text)
@@ -1453,7 +1802,6 @@ class AutoGrader(ttk.Frame):
                         file_label):
         """ Analyze results from submitting python code """
         # import re
-        import os.path
 
         # textx = text.split("\n")
         out_analysis = ''
@@ -1482,14 +1830,8 @@ class AutoGrader(ttk.Frame):
         self.write_text(out_analysis, pst)
         # self.write_text(letter, self.active_letter_file)
         if file_label == self.chosen_file.get():
-            self.messages.configure(state='normal')
-            self.messages.delete(1.0, tk.END)
-            self.messages.insert(tk.END, messages)
-            self.messages.configure(state='disabled')
-            self.output_analysis.configure(state="normal")
-            self.output_analysis.delete(1.0, tk.END)
-            self.output_analysis.insert(tk.END, out_analysis)
-            self.output_analysis.configure(state="disabled")
+            self.set_ro_text('messages', messages)
+            self.set_ro_text('output_analysis', out_analysis)
             # self.letter.delete(1.0, tk.END)
             # self.letter.insert(tk.END, letter)
         return (points_docked, points_text)
@@ -1497,98 +1839,73 @@ class AutoGrader(ttk.Frame):
     def req_and_prohib(self, config, text, code_or_output):
         """ Write output concerning required and prohibited text """
         # Check for required output
-        import re
         # Change '\r\n' to '\n' to facilate using search for '\n', because
         # '^' and '$' will not work on this multiline single text string.
-        text = re.sub('\r\n', '\n', text)
-        out_analysis = ''
+        text = text.replace('\r\n', '\n')
+        out_analysis = []
         points_docked = 0.0
-        item = 'req_' + code_or_output
-        req_output = config[item].split('\n')
-        req_output = [r.strip() for r in req_output]
-        for line in req_output:
-            if len(line) == 0:
-                continue
-            (points, line) = self.pull_off_points(line)
-            # Do the match (exact if quoted; otherwise a regular expression)
-            if line[0] == line[-1] and line[0] in "\"'":
-                if len(line) < 3:
-                    continue
-                ok = line[1:-2] in text
-            else:
-                try:
-                    req_re = re.compile(line)
-                except re.error:
+        # Required text is reported if absent, prohibited text if present
+        for (kind, required) in (('req_', True), ('prohib_', False)):
+            item = kind + code_or_output
+            (found, exhaustive) = self.fused_search(config, item, text)
+            for (points, line, matcher, regex, message) in \
+                    self.req_prohib_entries(config, item):
+                if matcher is None:
                     messagebox.showwarning("Cannot create regular expression",
                                            line + "is invalid")
                     return (-9999, "Bad Regular expression")
-                ok = req_re.search(text)
-            if not ok:
-                if points is None:
-                    out_analysis += "Missing output: " + line + "\n"
+                if regex is not None and found is not None and \
+                        (line in found or exhaustive):
+                    present = line in found
                 else:
-                    if points < 0.0:
-                        adj = "missing"
-                    else:
-                        adj = "avoided"
-                    out_analysis += str(points) + " points for " + adj + \
-                        " " + code_or_output + ": " + line + "\n"
-                    points_docked += points
-
-        # Check for prohibited output
-        item = 'prohib_' + code_or_output
-        prohib_output = config[item].split('\n')
-        prohib_output = [p.strip() for p in prohib_output]
-        for line in prohib_output:
-            if len(line) == 0:
-                continue
-            (points, line) = self.pull_off_points(line)
-            # Do the match (exact if quoted; otherwise a regular expression)
-            if line[0] == line[-1] and line[0] in "\"'":
-                if len(line) < 3:
-                    continue
-                bad = line[1:-2] in text
-            else:
-                prohib_re = re.compile(line)
-                bad = prohib_re.search(text)
-            if bad:
-                if points is None:
-                    out_analysis += "Prohibited output: " + line + "\n"
-                else:
-                    if points < 0.0:
-                        adj1 = ""
-                        adj2 = " prohibited"
-                    else:
-                        adj1 = " extra credit"
-                        adj2 = ""
-                    out_analysis += str(points) + adj1 + " points for" + \
-                        adj2 + " output: " + line + "\n"
-                    points_docked += points
-
-        return (points_docked, out_analysis)
+                    present = bool(matcher(text))
+                if present != required:
+                    out_analysis.append(message)
+                    if points is not None:
+                        points_docked += points
+
+        return (points_docked, "".join(out_analysis))
 
     def write_letter(self, codefile, total_points,
                      pre_analysis_points, pre_analysis_text,
                      post_analysis_points, post_analysis_text):
-        letter = "Analysis of homework file: " + codefile + "\n\n"
+        letter = ["Analysis of homework file: " + codefile + "\n\n"]
         if total_points is not None and pre_analysis_points is not None and \
                 post_analysis_points is not None:
             points_earned = total_points + pre_analysis_points + \
                             post_analysis_points
-            letter += "You scored " + str(points_earned) + \
-                      " out of " + str(total_points) + ".\n\n"
+            letter.append("You scored " + str(points_earned) +
+                          " out of " + str(total_points) + ".\n\n")
         if pre_analysis_text is not None:
-            letter += "\nCode analysis:\n" + pre_analysis_text
+            letter.append("\nCode analysis:\n" + pre_analysis_text)
         if post_analysis_text is not None:
-            letter += "\nAnalysis of results:\n" + post_analysis_text
+            letter.append("\nAnalysis of results:\n" + post_analysis_text)
+        letter = "".join(letter)
         self.write_text(letter, self.active_letter_file)
-        self.letter.delete(1.0, tk.END)
-        self.letter.insert(tk.END, letter)
+        self.set_text('letter', letter)
+        self._letter_saved_text = letter
+        return
+
+    def save_letter(self):
+        """
+        Save the (possibly edited) letter tab to the active letter file,
+        unless it still matches what was last loaded or saved.
+        """
+        if self.active_letter_file is None:
+            return
+        text = self.get_tab_text('letter')
+        if text != self._letter_saved_text:
+            self.write_text(text, self.active_letter_file)
+            self._letter_saved_text = text
         return
 
-    def submit_code(self, code, sandbox, index):
+    def prepare_submission(self, code, sandbox, index):
         """
-        Batch submit code from one file in a sandbox.
+        Prepare to batch submit code from one file in a sandbox: copy the
+        auxiliary files and write the code to be run.  Returns the
+        runstring (one command or a list of commands, to be run in the
+        sandbox by run_in_sandbox()) and the output file name, with a
+        runstring of None if the code cannot be run.
 
         .R mechanism is "R CMD BATCH [options] infile [outfile]".
         Important note: on Windows, new libraries are probably installed in
@@ -1602,10 +1919,6 @@ class AutoGrader(ttk.Frame):
         library("markdown"); markdown::render("myFile.md")
         to create myFile.html.
         """
-        import os.path
-        import os
-        import shutil
-        import subprocess
         codefile = self.codefile
         ext = self.get_extension(codefile).upper()
 
@@ -1660,24 +1973,16 @@ class AutoGrader(ttk.Frame):
                                                                    index)
         else:
             print("not coded yet")
-            return
-
-        # Run the code in the sandbox
-        # https://stackoverflow.com/questions/4760215/running-shell-command-
-        #         from-python-and-capturing-the-output
-        os.chdir(sandbox)
-        if type(runstring) is str:
-            code = subprocess.run(runstring, shell=True)
-        else:
-            codes = []
-            for rs in runstring:
-                codes.append(subprocess.run(rs, shell=True))
-            code = codes[-1]
-        os.chdir(self.dir)
+            return (None, None)
+        return (runstring, output_name)
 
-        # Analyze output
+    def finish_submission(self, returncode, output_name):
+        """
+        Record the exit code of a batch submission at the top of its output
+        file, and display the output.
+        """
         code_output = self.get_text(output_name)
-        err_msg = "[Error code is " + str(code.returncode) + "]"
+        err_msg = "[Error code is " + str(returncode) + "]"
         if code_output is None:
             code_output = err_msg
         else:
@@ -1685,10 +1990,7 @@ class AutoGrader(ttk.Frame):
 
         # Save and display output
         self.write_text(code_output, output_name)
-        self.output.configure(state='normal')
-        self.output.delete(1.0, tk.END)
-        self.output.insert(tk.END, code_output)
-        self.output.configure(state='disabled')
+        self.set_ro_text('output', code_output)
 
         return
 
@@ -1697,16 +1999,12 @@ class AutoGrader(ttk.Frame):
         Setup R runstring and make needed generic
         modifications to input code file.
         """
-        import os.path
-        import re
         sand_name = self.versioned_filename[index]
         output_name = os.path.join(sandbox, sand_name + "out")
         # Students tend to put help() or ? in code.
         # We want to remove that.
-        code = re.sub("((^|\\n)[:blank:]*)([?])",
-                      "\\1### ?", code)
-        code = re.sub("((^|\\n)[:blank:]*)help[(]",
-                      "\\1### help(", code)
+        code = _HELP_Q_RE.sub(r"\1### ?", code)
+        code = _HELP_FN_RE.sub(r"\1### help(", code)
 
         config = self.specific_configs[self.codefile + ".config"]
         prepend = config["code_prepend"].strip()
@@ -1719,35 +2017,25 @@ class AutoGrader(ttk.Frame):
         self.write_text(code,
                         os.path.join(sandbox, sand_name))
 
-        inoutfiles = '"' + sand_name + '"' + ' "' + sand_name + 'out"'
-        runstring = 'R CMD BATCH --no-save --no-restore --quiet ' + \
-                    inoutfiles
+        runstring = {'args': _R_BATCH_ARGS + [sand_name, sand_name + "out"]}
         return (runstring, output_name)
 
     def setup_RMD_runstring(self, code, sandbox, index):
-        import os
-        import os.path
-        import re
         sand_name = self.versioned_filename[index]
         output_name = os.path.join(sandbox, sand_name + ".out")
         base_name = sand_name[:-4]
-        code = re.sub("((^|\\n)[:blank:]*)([?])",
-                      "\\1### ?", code)
-        code = re.sub("((^|\\n)[:blank:]*)help[(]",
-                      "\\1### help(", code)
-        code = re.sub("pdf_document",
-                      "html_document", code)
-        code = re.sub("(w|W)ord_document",
-                      "html_document", code)
+        code = _HELP_Q_RE.sub(r"\1### ?", code)
+        code = _HELP_FN_RE.sub(r"\1### help(", code)
+        code = _PDF_DOC_RE.sub("html_document", code)
+        code = _WORD_DOC_RE.sub("html_document", code)
 
         config = self.specific_configs[self.codefile + ".config"]
         prepend = config["code_prepend"].strip()
         if prepend != "":
-            firstR_re = re.compile("\\n\\s*```\\s*[{]\\s*(r|R)")
-            firstR = firstR_re.search(code)
+            firstR = _FIRST_R_RE.search(code)
             if firstR is None or firstR.span(0)[0] == 0:
                 # Add popup message
-                return
+                return (None, None)
             firstR = firstR.span(0)[0]
             code = code[:firstR+2] + "```{r autoGrader Prepend}\n" + \
                 prepend + "\n```\n\n" + code[firstR+2:]
@@ -1768,23 +2056,18 @@ class AutoGrader(ttk.Frame):
         knit_filename = sand_name + ".knit.R"
         self.write_text(knit_file_text, os.path.join(sandbox, knit_filename))
 
-        inoutfiles = '"' + knit_filename + '"' + ' "' + sand_name + \
-                     'out"'
-        runstring = 'R CMD BATCH --no-save --no-restore --quiet ' + \
-                    inoutfiles
         cwd = os.getcwd()
-        runstring = [runstring, 'start ' +
-                     os.path.join(cwd, sandbox, sand_name + '.html')]
+        runstring = [{'args': _R_BATCH_ARGS + [knit_filename,
+                                               sand_name + "out"]},
+                     {'open': os.path.join(cwd, sandbox,
+                                           sand_name + '.html')}]
         return (runstring, output_name)
 
     def setup_SAS_runstring(self, code, sandbox, index):
         # http://www2.sas.com/proceedings/forum2008/017-2008.pdf
-        import os.path
-        import re
         sand_name = self.versioned_filename[index]
         output_name = os.path.join(sandbox, sand_name + "out")
-        code = re.sub("((^|\\n)\\s*)(%LET\\s+WD\\s*=.*;)",
-                      "\\1%LET WD=.;", code, flags=re.IGNORECASE)
+        code = _SAS_WD_RE.sub(r"\1%LET WD=.;", code)
         config = self.specific_configs[self.codefile + ".config"]
         to_pdf = config["pdf_output"].strip().upper()
         if to_pdf == "Y":
@@ -1801,15 +2084,15 @@ class AutoGrader(ttk.Frame):
         self.write_text(code,
                         os.path.join(sandbox, sand_name))
 
-        inoutfiles = '-SYSIN ' + sand_name + \
-                     ' -ICON -NOSPLASH -NONEWS -LOG ' + \
-                     sand_name + 'log -PRINT ' + sand_name + "out"
-        runstring = '"' + self.SAS_prog + '" ' + inoutfiles
+        runstring = {'args': [self.SAS_prog, '-SYSIN', sand_name,
+                              '-ICON', '-NOSPLASH', '-NONEWS',
+                              '-LOG', sand_name + 'log',
+                              '-PRINT', sand_name + "out"]}
         if to_pdf == "Y":
             cwd = os.getcwd()
-            runstring = [runstring, 'start ' +
-                         os.path.join(cwd, sandbox,
-                                      sand_name + '.' + sandbox + '.pdf')]
+            runstring = [runstring,
+                         {'open': os.path.join(cwd, sandbox, sand_name + '.' +
+                                               sandbox + '.pdf')}]
         return (runstring, output_name)
 
     def setup_python_runstring(self, code, sandbox, index):
@@ -1817,35 +2100,30 @@ class AutoGrader(ttk.Frame):
         Setup python runstring and make needed generic
         modifications to input code file.
         """
-        import os.path
-        import re
         sand_name = self.versioned_filename[index]
         output_name = os.path.join(sandbox, sand_name + "out")
         # Students tend to put dir() or ? in code.
         # We want to remove that.
-        code = re.sub("((^|\\n)[:blank:]*)([?])",
-                      "\\1### ?", code)
-        code = re.sub("((^|\\n)[:blank:]*)help[(]",
-                      "\\1### dir(", code)
+        code = _PY_HELP_Q_RE.sub(r"\1### ?", code)
+        code = _PY_HELP_FN_RE.sub(r"\1### dir(", code)
 
         config = self.specific_configs[self.codefile + ".config"]
         prepend = config["code_prepend"].strip()
-        prepend = re.sub("[*]{4}", "    ", prepend)
-        prepend = re.sub("[*]{8}", "        ", prepend)
+        prepend = _STAR4_RE.sub("    ", prepend)
+        prepend = _STAR8_RE.sub("        ", prepend)
         if prepend != "":
             code = prepend + "\n" + code
         append = config["code_append"].strip()
-        append = re.sub("[*]{4}", "    ", append)
-        append = re.sub("[*]{8}", "        ", append)
+        append = _STAR4_RE.sub("    ", append)
+        append = _STAR8_RE.sub("        ", append)
         if append != "":
             code = code + "\n" + append + "\n"
 
         self.write_text(code,
                         os.path.join(sandbox, sand_name))
 
-        inoutfiles = '< "' + sand_name + '"' + '1> "' + sand_name + 'out"' +\
-            '2> "' + sand_name + 'err"'
-        runstring = 'python ' + inoutfiles
+        runstring = {'args': ['python'], 'stdin': sand_name,
+                     'stdout': sand_name + 'out', 'stderr': sand_name + 'err'}
         return (runstring, output_name)
 
     def get_dir_name(self, index):
@@ -1853,7 +2131,6 @@ class AutoGrader(ttk.Frame):
         Given the student index, return an appropriate sandbox directory name.
         If the email is available, use that, otherwise remove punctuation.
         """
-        import re
         if self.email[index] != "":
             return self.email[index]
         f = self.student_name[index]
@@ -1864,12 +2141,10 @@ class AutoGrader(ttk.Frame):
         Let user update the general configuration for the currently active
         directory (assignment).
         """
-        import copy
-        import time
         old_file_format = self.general_config['file_format']
         old_codefiles = self.general_config['codefiles']
         old_course_id = self.general_config['course_id']
-        gconfig = copy.copy(self.general_config)
+        gconfig = self.general_config.copy()
         title = "AutoGrader: General Configuration"
         self.conf_dialog = ConfigDialog(self, info=[self.general_config_setup,
                                                     gconfig],
@@ -1908,7 +2183,6 @@ class AutoGrader(ttk.Frame):
             self.read_roster()
 
     def get_text(self, filename):
-        import codecs
         try:
             with codecs.open(filename, 'r', encoding='utf-8',
                              errors='replace') as myfile:
@@ -1917,6 +2191,46 @@ class AutoGrader(ttk.Frame):
             text = None
         return text
 
+    def get_byte_lines(self, filename):
+        """
+        Yield the lines of a file as undecoded bytes (without the newlines),
+        reading it one line at a time.  Nothing is yielded if it cannot be
+        opened.
+        """
+        try:
+            myfile = open(filename, 'rb')
+        except IOError:
+            return
+        with myfile:
+            for line in myfile:
+                yield line[:-1] if line[-1:] == b"\n" else line
+
+    def get_cached_text(self, filename):
+        """
+        Like get_text(), but reuse the previously read contents of 'filename'
+        if its modification time (in ns) and size have not changed; a file
+        rewritten within the file system's timestamp resolution usually
+        differs in size.  The most recently used self.text_cache_size files
+        are kept.
+        """
+        try:
+            st = os.stat(filename)
+        except OSError:
+            return None
+        stamp = (st.st_mtime_ns, st.st_size)
+        key = os.path.abspath(filename)
+        cached = self._text_cache.pop(key, None)
+        if cached is not None and cached[0] == stamp:
+            text = cached[1]
+        else:
+            text = self.get_text(filename)
+            if text is None:
+                return None
+        self._text_cache[key] = (stamp, text)
+        if len(self._text_cache) > self.text_cache_size:
+            del self._text_cache[next(iter(self._text_cache))]
+        return text
+
     def get_text_and_put_in_tab(self, filename, tabname, default,
                                 disabled=False, SAS=False):
         """
@@ -1925,43 +2239,118 @@ class AutoGrader(ttk.Frame):
         If 'SAS' is True, replace chr(402) with "-", chr(12) with '\n'.
         'disabled' can be used to prevent editing.
         """
-        text = self.get_text(filename)
-        if SAS:
-            text = text.replace(chr(402), "-").replace(chr(12), "\n")
+        text = self.get_cached_text(filename)
+        if SAS and text is not None:
+            text = text.translate(_SAS_TRANS)
+        shown = default if text is None else text + "\n\n\n"
         if disabled:
-            tabname.configure(state='normal')
-        tabname.delete(1.0, tk.END)
-        if text is None:
-            tabname.insert(tk.END, default)
+            self.set_ro_text(tabname, shown)
         else:
-            tabname.insert(tk.END, text+"\n\n\n")
-        if disabled:
-            tabname.configure(state='disabled')
+            self.set_text(tabname, shown)
         return text
 
+    def get_tab_text(self, tab):
+        """
+        Return the text in notebook tab 'tab' (e.g., 'letter'), read from
+        the pane if the tab is the (editable) letter on display.
+        """
+        if tab == 'letter' and tab == self._pane_tab:
+            return self.pane.get("1.0", "end-1c")
+        return self._tab_text.get(tab, '')
+
+    def set_text(self, tab, text):
+        """
+        Replace the contents of editable notebook tab 'tab' with 'text',
+        unless it already holds exactly that text.  (Its contents may have
+        been edited, so they are checked rather than remembered.)
+        """
+        if tab != self._pane_tab:
+            self._tab_text[tab] = text
+        elif self.pane.get("1.0", "end-1c") != text:
+            self.pane.replace("1.0", tk.END, text)
+        return
+
+    def set_ro_text(self, tab, text):
+        """
+        Replace the contents of read-only (disabled) notebook tab 'tab'
+        with 'text'.  Nothing is done if 'text' is already displayed.
+        If the tab is on display, the pane is rewritten once the GUI is
+        idle, so that a burst of writes costs only one.
+        """
+        if self._tab_text.get(tab) == text:
+            return
+        self._tab_text[tab] = text
+        if tab == self._pane_tab and not self._pane_pending:
+            self._pane_pending = True
+            self.after_idle(self.flush_pane)
+        return
+
+    def flush_pane(self):
+        """
+        Write the latest text of the read-only tab on display into the
+        pane (scheduled by set_ro_text()).
+        """
+        self._pane_pending = False
+        tab = self._pane_tab
+        if tab == 'letter':  # the letter was selected in the meantime
+            return
+        pane = self.pane
+        pane.configure(state='normal')
+        pane.replace(1.0, tk.END, self._tab_text.get(tab, ''))
+        pane.configure(state='disabled')
+        return
+
+    def show_tab(self, tab):
+        """
+        Swap the text of notebook tab 'tab' into the shared Text pane,
+        first keeping any edits to the letter if that was on display.
+        Only the letter can be edited.
+        """
+        pane = self.pane
+        if self._pane_tab == 'letter':
+            self._tab_text['letter'] = pane.get("1.0", "end-1c")
+        self._pane_tab = tab
+        pane.configure(state='normal')
+        pane.replace(1.0, tk.END, self._tab_text.get(tab, ''))
+        if tab != 'letter':
+            pane.configure(state='disabled')
+        return
+
+    def on_tab_changed(self, event=None):
+        """ Show the newly selected notebook tab in the Text pane """
+        tab = self._tab_titles[self.notebook.index('current')][0]
+        if tab != self._pane_tab:
+            self.show_tab(tab)
+        return
+
     def write_text(self, text, fname, directory=None):
         """
         Write text to file directory/fname.
         As an aid to auto-save of letters when switching students,
         ignore this request if the directory does not exist.
         """
-        import os.path
-        import re
-        import codecs
+        self.write_text_parts([text], fname, directory)
+        return
 
+    def write_text_parts(self, parts, fname, directory=None):
+        """
+        Like write_text(), but write each string of iterable 'parts' in
+        turn, so that they need not be joined in memory first.
+        """
         if directory is not None:
             fname = os.path.join(directory, fname)
         if not os.path.exists(os.path.dirname(fname)):
             return
-
-        # Somehow carriage returns are sneaking in and
-        # causing problems in R.
-        text = re.sub("\r+\n", "\n", text)
+        self._text_cache.pop(os.path.abspath(fname), None)
 
         try:
-            with codecs.open(fname, 'w', encoding='utf-8',
-                             errors='replace') as out:
-                out.write(text)
+            with open(fname, 'wb') as out:
+                for text in parts:
+                    # Somehow carriage returns are sneaking in and
+                    # causing problems in R.
+                    if "\r" in text:
+                        text = _CR_RUN_RE.sub("\n", text)
+                    out.write(text.encode('utf-8', 'replace'))
         except IOError:
             messagebox.showwarning("File write error",
                                    "Could not write " + fname)
@@ -1972,7 +2361,6 @@ class AutoGrader(ttk.Frame):
         Let user update the specific configuration for the currently active
         codefile (an element of the self.specific.configs dictionary).
         """
-        import time
         if self.codefile is None:
             raise(Exception("Program error: editing with no codefiles"))
         cfb = self.codefile  # base
@@ -2025,174 +2413,104 @@ class AutoGrader(ttk.Frame):
 
         # Main GUI
         max_span = self.max_codefiles
+        pad = dict(padx=5, pady=5)  # spacing of each widget in the grid
         line = 0  # radio buttons for individual codefiles
         self.cf_index = tk.IntVar()
-        self.cf_radio_dict = {}
-        self.cf_text_dict = {}
+        self.cf_radios = [None] * self.max_codefiles
+        # StringVars, only for buttons of current codefiles (else None)
+        self.cf_texts = [None] * self.max_codefiles
         ### Need to init.gui when self.codefiles is None!!!!
         cf_n = len(self.codefiles)
         self.cf_index.set(0)
-        self.cf_index.trace("w", self.choose_codefile)
         for i in range(self.max_codefiles):
-            self.cf_text_dict[i] = tk.StringVar()
             if i >= cf_n:
-                self.cf_text_dict[i].set('')
-                self.cf_radio_dict[i] = \
+                self.cf_radios[i] = \
                     tk.Radiobutton(self,
                                    variable=self.cf_index,
                                    value=i,
-                                   textvariable=self.cf_text_dict[i],
+                                   text='',
+                                   state=tk.DISABLED,
                                    command=self.choose_codefile)
-                self.cf_radio_dict[i].config(state=tk.DISABLED)
             else:
-                self.cf_text_dict[i].set(self.codefiles[i])
+                self.cf_texts[i] = tk.StringVar()
+                self.cf_texts[i].set(self.codefiles[i])
                 state = tk.ACTIVE if i == 0 else tk.NORMAL
-                self.cf_radio_dict[i] = \
+                self.cf_radios[i] = \
                     tk.Radiobutton(self,
                                    variable=self.cf_index,
                                    value=i,
-                                   textvariable=self.cf_text_dict[i],
+                                   textvariable=self.cf_texts[i],
                                    state=state,
                                    command=self.choose_codefile)
-            self.cf_radio_dict[i].grid(column=i, row=line, sticky='ew')
-        self.cf_radio_dict[0].select()
+            self.cf_radios[i].grid(column=i, row=line, sticky='ew', **pad)
 
         line += 1  # File count
+        self._file_count_shown = len(self.filename)
         self.file_count = tk.Label(self,
                                    text="File count: " +
-                                   str(len(self.filename)))
+                                   str(self._file_count_shown))
         self.file_count.grid(column=0, row=line, columnspan=max_span,
-                             sticky='w')
+                             sticky='w', **pad)
 
         # Drop down menu of student files
+        # The menu is built once; set_student_files() changes its choices.
         self.chosen_file = tk.StringVar(self)
-        if self.file_label is None or len(self.file_label) == 0:
-            first = ''
-            labels = ['']
-        else:
-            first = self.file_label[0]
-            labels = self.file_label
-        self.chosen_file.set(first)
+        self.dropdownMenu = tk.OptionMenu(self, self.chosen_file, '')
+        self._student_menu = self.dropdownMenu["menu"]
+        self.set_student_files(self.file_label or [])
         # Reference: https://stackoverflow.com/questions/22462654/getting-the-
         # choice-of-optionmenu-right-after-selection-python
         self.chosen_file.trace("w", self.choose_student_file)
-        self.dropdownMenu = tk.OptionMenu(self, self.chosen_file,
-                                          *labels)
         self.dropdownMenu.grid(column=1, row=line, columnspan=1,
-                               sticky='ew')
+                               sticky='ew', **pad)
         self.student_menu_built = True
 
         # action buttons
         self.run_one_b = tk.Button(self, text='Run one',
                                    command=self.run_one)
-        self.run_one_b.grid(column=2, row=line, columnspan=1)
+        self.run_one_b.grid(column=2, row=line, columnspan=1, **pad)
         self.run_all_b = tk.Button(self, text='Run pending',
                                    command=self.run_all)
-        self.run_all_b.grid(column=3, row=line, columnspan=1)
+        self.run_all_b.grid(column=3, row=line, columnspan=1, **pad)
 
         line += 1
         ttk.Separator(self, orient='horizontal').grid(column=0, row=line,
                                                       columnspan=max_span,
-                                                      sticky='ew')
+                                                      sticky='ew', **pad)
 
         line += 1  # Notebook of codefiles and results
         self.nb_width = 1200
         self.nb_cwidth = int(self.nb_width / 8) - 3
-        nb = self.notebook = ttk.Notebook(self, height=600,
-                                          width=self.nb_width)
+        # The notebook only selects a tab: its frames are empty, and the
+        # selected tab's text is swapped into the one Text pane below it.
+        nb = self.notebook = ttk.Notebook(self, width=self.nb_width,
+                                          takefocus=0)
         self.notebook.grid(column=0, row=line, columnspan=max_span,
-                           sticky="nsew")
-
-        self.input_frame = tk.Frame(nb)
-        self.input_analysis_frame = tk.Frame(nb)
-        self.messages_frame = tk.Frame(nb)
-        self.output_frame = tk.Frame(nb)
-        self.output_analysis_frame = tk.Frame(nb)
-        self.letter_frame = tk.Frame(nb)
-
-        self.input_frame.grid(row=line, column=0, sticky="nsew")
-        self.input_analysis_frame.grid(row=line, column=0, sticky="nsew")
-        self.messages_frame.grid(row=line, column=0, sticky="nsew")
-        self.output_frame.grid(row=line, column=0, sticky="nsew")
-        self.output_analysis_frame.grid(row=line, column=0, sticky="nsew")
-        self.letter_frame.grid(row=line, column=0, sticky="nsew")
-
-        self.sbi = tk.Scrollbar(self.input_frame)
-        self.sbia = tk.Scrollbar(self.input_analysis_frame)
-        self.sbm = tk.Scrollbar(self.messages_frame)
-        self.sbo = tk.Scrollbar(self.output_frame)
-        self.sboa = tk.Scrollbar(self.output_analysis_frame)
-        self.sbl = tk.Scrollbar(self.letter_frame)
-
-        self.input = tk.Text(self.input_frame, bg="lightblue",
-                             width=self.nb_cwidth, height=41,
-                             yscrollcommand=self.sbi.set)
-        self.input_analysis = tk.Text(self.input_analysis_frame,
-                                      bg="lightblue",
-                                      width=self.nb_cwidth, height=41,
-                                      yscrollcommand=self.sbia.set)
-        self.messages = tk.Text(self.messages_frame, bg="lightblue",
-                                width=self.nb_cwidth, height=41,
-                                yscrollcommand=self.sbm.set)
-        self.output = tk.Text(self.output_frame, bg="lightblue",
-                              width=self.nb_cwidth, height=41,
-                              yscrollcommand=self.sbo.set)
-        self.output_analysis = tk.Text(self.output_analysis_frame,
-                                       bg="lightblue",
-                                       width=self.nb_cwidth, height=41,
-                                       yscrollcommand=self.sboa.set)
-        self.letter = tk.Text(self.letter_frame,
-                              bg="lightblue",
-                              width=self.nb_cwidth, height=41,
-                              yscrollcommand=self.sbl.set)
-
-        self.sbi.grid(row=0, column=1, sticky="ens")
-        self.input.grid(row=0, column=0, columnspan=1, sticky="ewnw")
-        self.sbia.grid(row=0, column=1, sticky="ens")
-        self.input_analysis.grid(row=0, column=0, columnspan=1, sticky="ewnw")
-        self.sbm.grid(row=0, column=1, sticky="ens")
-        self.messages.grid(row=0, column=0, columnspan=1, sticky="ewnw")
-        self.sbo.grid(row=0, column=1, sticky="ens")
-        self.output.grid(row=0, column=0, columnspan=1, sticky="ewnw")
-        self.sboa.grid(row=0, column=1, sticky="ens")
-        self.output_analysis.grid(row=0, column=0, columnspan=1, sticky="ewnw")
-        self.sbl.grid(row=0, column=1, sticky="ens")
-        self.letter.grid(row=0, column=0, columnspan=1, sticky="ewnw")
-
-        self.sbi.config(command=self.input.yview)
-        self.sbia.config(command=self.input_analysis.yview)
-        self.sbm.config(command=self.messages.yview)
-        self.sbo.config(command=self.output.yview)
-        self.sboa.config(command=self.output_analysis.yview)
-        self.sbl.config(command=self.letter.yview)
-
-        nb.add(self.input_frame, text="input", sticky="nsw")
-        nb.add(self.input_analysis_frame, text="input analysis")
-        nb.add(self.messages_frame, text="messages")
-        nb.add(self.output_frame, text="output")
-        nb.add(self.output_analysis_frame, text="output analysis")
-        nb.add(self.letter_frame, text="letter")
+                           sticky="nsew", **pad)
+        for (tab, title) in self._tab_titles:
+            nb.add(tk.Frame(nb), text=title)
+
+        line += 1  # Text pane showing the selected tab, and its scrollbar
+        # Use Tk's own fixed font object rather than a new one per pane
+        self.pane_font = tkfont.nametofont('TkFixedFont')
+        (self.pane, self.sb) = scrolled_text(self, bg="lightblue",
+                                             font=self.pane_font,
+                                             width=self.nb_cwidth,
+                                             height=41, state='disabled')
+        self.pane.grid(column=0, row=line, columnspan=max_span,
+                       sticky="nsew", **pad)
+        self.sb.grid(column=max_span, row=line, sticky="ns", pady=5)
 
         # self.notebook.grid(column=0, row=line, columnspan=max_span)
-        if self.current_code is None:
-            self.input.insert(tk.END, "(No input)")
-        else:
-            self.input.insert(tk.END, self.current_code)
-        self.input_analysis.insert(tk.END, "(No input analysis)")
-        self.messages.configure(state='normal')
-        self.messages.insert(tk.END, "(No message)")
-        self.messages.configure(state='disabled')
-        self.output.insert(tk.END, "(No output)")
-        self.output_analysis.insert(tk.END, "(No output analysis)")
+        # The pane starts empty: update_gui() fills in every tab.
+        self._pane_tab = 'input'  # tab whose text is in the pane
+        self._pane_pending = False  # flush_pane() is scheduled
+        nb.bind("<<NotebookTabChanged>>", self.on_tab_changed)
 
         line += 1  # Close button
         self.close_but = ttk.Button(self, text='Exit autoGrader',
                                     command=self.root.destroy)
-        self.close_but.grid(column=0, row=line, columnspan=max_span)
-
-        # Fix spacing
-        for child in self.winfo_children():
-            child.grid_configure(padx=5, pady=5)
+        self.close_but.grid(column=0, row=line, columnspan=max_span, **pad)
 
         return
 
@@ -2205,73 +2523,67 @@ class ConfigDialog(Dialog):
     """
 
     def body(self, master):
-        self.d_widgets = {}
-        for i in range(len(self.info[0])):
-            setup = self.info[0][i]
-            id = setup[0]
-            data = self.info[1][id]
+        self.d_widgets = widgets = {}
+        config = self.info[1]
+        # (id, type, default, widget) for apply(), and (label, widget) of
+        # the 'int' entries for validate()
+        schema = []
+        int_fields = []
+        for setup in self.info[0]:
+            (id, label, kind) = setup[:3]
             if id == 'config_mod_time':
-                pass
-            elif setup[2] == 'int':
-                self.d_widgets[id] = ttk.Entry(master)
-            elif setup[2] == 'box':
-                self.d_widgets[id] = tk.Text(master,
-                                             height=setup[3][0],
-                                             width=setup[3][1])
-            elif setup[2] == 'line':
-                self.d_widgets[id] = tk.Entry(master,
-                                              width=setup[3])
-            else:
+                continue
+            try:
+                make_widget = _CONFIG_WIDGETS[kind]
+            except KeyError:
                 raise(Exception('bad config setup type'))
-            ttk.Label(master, text=setup[1]).pack()
-            self.d_widgets[id].pack(padx=5)
-            ipos = tk.END if setup[2] == 'box' else 0
-            self.d_widgets[id].insert(ipos, data)
+            widget = make_widget(master, setup)
+            if kind == 'int':
+                int_fields.append((label, widget))
+            widgets[id] = widget
+            schema.append((id, kind, setup[4], widget))
+            ttk.Label(master, text=label).pack()
+            widget.pack(padx=5)
+            ipos = tk.END if kind == 'box' else 0
+            widget.insert(ipos, config[id])
+        self._schema = tuple(schema)
+        self._int_fields = tuple(int_fields)
 
     def validate(self):
-        ii = None
-        try:
-            for i in range(len(self.info[0])):
-                ii = i
-                thisInfo = self.info[0][i]
-                thisWidget = self.d_widgets[thisInfo[0]]
-                if thisInfo[2] == 'int':
-                    thisData = thisWidget.get().strip()
-                    if thisData != '':
-                        int(thisData)
-            return 1
-        except ValueError:
-            msg = '"' + self.info[0][ii][1] + '" requires blank or an ' + \
-                  'integer.  Please try again.'
-            # self.grab_set()
-            messagebox.showwarning("Bad input", msg)
-            #  self.wait_window()
-            return 0
+        for (label, widget) in self._int_fields:
+            thisData = widget.get().strip()
+            if thisData != '':
+                try:
+                    int(thisData)
+                except ValueError:
+                    msg = '"' + label + '" requires blank or an ' + \
+                          'integer.  Please try again.'
+                    # self.grab_set()
+                    messagebox.showwarning("Bad input", msg)
+                    #  self.wait_window()
+                    return 0
+        return 1
 
     def apply(self):
-        self.result = {}
-        for i in range(len(self.info[0])):
-            thisInfo = self.info[0][i]
-            thisWidget = self.d_widgets[thisInfo[0]]
-            id = thisInfo[0]
-            if thisInfo[2] == 'int':
-                thisData = thisWidget.get().strip()
-                if thisData == '':
-                    self.result[id] = thisInfo[4]
-                else:
-                    self.result[id] = int(thisData)
-            elif thisInfo[2] == 'box':
-                value = self.d_widgets[id].get(1.0, tk.END)
-                if len(value) > 0 and value[-1] == "\n":
-                    value = value[:-1]
-                self.result[id] = value
-            elif thisInfo[2] == 'line':
-                value = self.d_widgets[id].get()
-                if len(value) > 0 and value[-1] == "\n":
-                    value = value[:-1]
-                self.result[id] = value
+        self.result = result = {}
+        for (id, kind, default, widget) in self._schema:
+            value = _CONFIG_GETTERS[kind](widget)
+            if kind == 'int':
+                result[id] = default if value == '' else int(value)
             else:
-                raise(Exception('bad config setup type'))
+                if value.endswith("\n"):
+                    value = value[:-1]
+                result[id] = value
+
+    def destroy(self):
+        """
+        Destroy the dialog (on both OK and Cancel) and drop the references
+        to its entry widgets, which the caller's saved dialog would
+        otherwise keep alive.
+        """
+        self.d_widgets = {}
+        self._schema = self._int_fields = ()
+        Dialog.destroy(self)
 
 
 if __name__ == '__main__':